@@ -0,0 +1,260 @@
+import argparse
+import functools
+import glob
+import io
+import json
+import os
+import sys
+
+from PIL import Image
+
+# package imports, batch is run as "python -m PyPhotoEditor.batch" and doesn't need tkinter
+from . import operations
+from . import orientation
+from .atomic_file import atomic_write
+from .packed_image import image_nbytes
+from .pipeline import Pipeline, Stage, QUEUE_SIZE
+from .profiler import profiler, profiled
+
+# PIL releases GIL while decoding, editing and encoding, so every stage runs in threads
+BATCH_WORKERS = os.cpu_count() or 1
+DECODE_WORKERS = os.cpu_count() or 1
+ENCODE_WORKERS = os.cpu_count() or 1
+WRITE_WORKERS = 2
+
+
+class StepAction(argparse.Action):
+    # operations are applied in the order they are given in command line
+    def __init__(self, option_strings, dest, convert=None, **kwargs):
+        super().__init__(option_strings, dest, **kwargs)
+        self.convert = convert
+
+    def __call__(self, parser, namespace, values, option_string=None):
+        values = values if isinstance(values, list) else [values]
+        try:
+            args = self.convert(*values)
+        except ValueError as e:
+            parser.error(f"{option_string}: {e}")
+
+        steps = list(getattr(namespace, self.dest) or [])
+        steps.append((self.const, args))
+        setattr(namespace, self.dest, steps)
+
+
+class RecipeAction(argparse.Action):
+    # steps of recipe exported from the editor are inserted at its place among other operations
+    def __call__(self, parser, namespace, path, option_string=None):
+        try:
+            with open(path, 'r') as f:
+                recipe = operations.recipe_from_dict(json.load(f))
+        except (OSError, ValueError, KeyError, IndexError, TypeError, AttributeError) as e:
+            parser.error(f"{option_string}: can't read recipe '{path}': {e}")
+
+        steps = list(getattr(namespace, self.dest) or [])
+        steps.extend(recipe)
+        setattr(namespace, self.dest, steps)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m PyPhotoEditor.batch",
+        description="Apply PyPhotoEditor operations to many images."
+    )
+    parser.add_argument("patterns", nargs="+", help="glob patterns of the images, ** matches subdirectories")
+    parser.add_argument("-o", "--output", required=True, help="directory for the edited images")
+    parser.add_argument("--format", help="extension of the edited images, the original one by default")
+    parser.add_argument("-j", "--workers", type=int, default=BATCH_WORKERS, help="threads which edit images")
+    parser.add_argument("--decoders", type=int, default=DECODE_WORKERS, help="threads which decode images")
+    parser.add_argument("--encoders", type=int, default=ENCODE_WORKERS, help="threads which encode images")
+    parser.add_argument("--writers", type=int, default=WRITE_WORKERS, help="threads which write files")
+    parser.add_argument(
+        "--queue-size", type=int, default=QUEUE_SIZE,
+        help="images waiting between two stages, it bounds the used memory"
+    )
+    parser.add_argument("--profile", metavar="FILE", help="write timings of stages and operations to .json or .csv")
+
+    steps = parser.add_argument_group("operations", "applied in the given order, every one can be repeated")
+    steps.add_argument(
+        "--recipe", dest="steps", action=RecipeAction, metavar="FILE",
+        help="JSON recipe, exported by Edit > Export recipe"
+    )
+    steps.add_argument(
+        "--rotate", dest="steps", action=StepAction, const="rotate", metavar="DEGREES",
+        convert=lambda degrees: (float(degrees),), help="rotate counterclockwise"
+    )
+    steps.add_argument(
+        "--flip", dest="steps", action=StepAction, const="flip", choices=list(operations.FLIPS),
+        convert=lambda side: (operations.FLIPS[side],)
+    )
+    steps.add_argument(
+        "--resize", dest="steps", action=StepAction, const="resize", metavar="PERCENTS",
+        convert=lambda percents: (int(percents),)
+    )
+    steps.add_argument(
+        "--crop", dest="steps", action=StepAction, const="crop", nargs=4, metavar=("X0", "Y0", "X1", "Y1"),
+        convert=lambda *box: ([int(x) for x in box],), help="box in pixels, it must be inside every image"
+    )
+    steps.add_argument(
+        "--filter", dest="steps", action=StepAction, const="filter", choices=list(operations.FILTERS),
+        convert=lambda name: (name,)
+    )
+    steps.add_argument(
+        "--convert", dest="steps", action=StepAction, const="convert", choices=list(operations.CONVERT_MODES),
+        convert=lambda mode: (mode,)
+    )
+    steps.add_argument(
+        "--enhance", dest="steps", action=StepAction, const="enhance", nargs=2, metavar=("NAME", "FACTOR"),
+        convert=enhance_args
+    )
+
+    args = parser.parse_args(argv)
+    if not args.steps:
+        parser.error("no operations are given")
+    return args
+
+
+def enhance_args(name, factor):
+    if name not in operations.ENHANCERS:
+        raise ValueError(f"unknown enhancer '{name}', choose from {', '.join(operations.ENHANCERS)}")
+    return name, float(factor)
+
+
+class BatchJob:
+    def __init__(self, path, output):
+        self.path = path
+        self.output = output
+        self.image = None
+        self.data = None
+
+
+def find_images(patterns, output_dir, output_format=None):
+    # files are found lazily, only names of the outputs are remembered to find collisions,
+    # so memory of discovery grows by one name per file while images take constant memory
+    outputs = set()
+
+    for pattern in patterns:
+        for path in glob.iglob(pattern, recursive=True):
+            if not os.path.isfile(path):
+                continue
+
+            # file matched by several patterns gives the same output too
+            output = output_path(path, output_dir, output_format)
+            if output in outputs:
+                print(f"Skipped '{path}': '{output}' is already written from this or another image", file=sys.stderr)
+                continue
+            outputs.add(output)
+
+            yield BatchJob(path, output)
+
+
+def output_path(path, output_dir, output_format=None):
+    name, ext = os.path.splitext(os.path.basename(path))
+    if output_format:
+        ext = "." + output_format.lstrip(".")
+    return os.path.join(output_dir, name + ext)
+
+
+def apply_steps(image, steps):
+    # rotations and flips in a row are done as one transpose
+    pending = 1
+    for name, args in steps:
+        transform = orientation.from_operation(name, *args)
+        if transform is not None:
+            pending = orientation.compose(pending, transform)
+            continue
+
+        image = orientation.transpose(image, pending)
+        with profiler.measure(name, image.width * image.height) as measurement:
+            image = operations.OPERATIONS[name](image, *args)
+            measurement.nbytes = image_nbytes(image)
+        pending = 1
+    return orientation.transpose(image, pending)
+
+
+def job_pixels(job):
+    return job.image.width * job.image.height if job.image is not None else 0
+
+
+def job_nbytes(job, *args):
+    return image_nbytes(job.image) if job.image is not None else 0
+
+
+@profiled("decode", result_pixels=job_pixels, nbytes=job_nbytes)
+def decode(job):
+    with Image.open(job.path) as image:
+        image.load()
+        # images are edited upright, as the editor shows them
+        job.image = orientation.upright(image)
+    return job
+
+
+def edit(job, steps):
+    job.image = apply_steps(job.image, steps)
+    return job
+
+
+@profiled("encode", pixels=job_pixels)
+def encode(job):
+    ext = os.path.splitext(job.output)[1].lower()
+    formats = Image.registered_extensions()
+    if ext not in formats:
+        raise ValueError(f"Unknown image extension: '{ext}'")
+
+    data = io.BytesIO()
+    job.image.save(data, format=formats[ext])
+    job.image = None
+    job.data = data.getvalue()
+    return job
+
+
+@profiled("write")
+def write(job):
+    with atomic_write(job.output) as f:
+        f.write(job.data)
+    job.data = None
+    return job.output
+
+
+def batch_pipeline(args):
+    # discover -> decode -> edit -> encode -> write, memory of images doesn't depend on number of files
+    return Pipeline([
+        Stage(decode, args.decoders),
+        Stage(functools.partial(edit, steps=args.steps), args.workers),
+        Stage(encode, args.encoders),
+        Stage(write, args.writers),
+    ], queue_size=args.queue_size)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    os.makedirs(args.output, exist_ok=True)
+    if args.profile:
+        profiler.enable()
+
+    found = 0
+    failed = 0
+    jobs = find_images(args.patterns, args.output, args.format)
+    # results are reported as soon as every image is written
+    for job, output, error in batch_pipeline(args).run(jobs):
+        found += 1
+        if error is not None:
+            failed += 1
+            print(f"Can't process '{job.path}': {error}", file=sys.stderr)
+        else:
+            print(output)
+
+    if args.profile:
+        with atomic_write(args.profile, 'w', newline='') as f:
+            if args.profile.lower().endswith(".csv"):
+                profiler.export_csv(f)
+            else:
+                profiler.export_json(f)
+
+    if not found:
+        print("No images match the given patterns", file=sys.stderr)
+        return 1
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,517 @@
+import argparse
+import datetime
+import fnmatch
+import gc
+import itertools
+import json
+import math
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import os
+
+import numpy as np
+import PIL
+from PIL import Image, ImageChops
+
+import operations
+from atomic_file import atomic_write
+from fake_canvas import FakeCanvas, CANVAS_WIDTH, CANVAS_HEIGHT
+from history import Keyframe
+from image_edit import ImageEdit, TILE_SIZE, PREVIEW_QUALITY, FINAL_QUALITY
+from image_pyramid import ImagePyramid
+
+MODES = ("1", "L", "RGB", "RGBA", "CMYK")
+# megapixels of the synthetic images, large sizes are chosen explicitly because they need a lot of memory
+SIZES = (1, 4, 16, 50, 200)
+DEFAULT_SIZES = (1, 4)
+REPEAT = 3
+
+# noise over the gradients, so filters and history deltas see real pixel differences
+NOISE_SEED = 2024
+NOISE_AMPLITUDE = 24
+NOISE_TILE = 509
+
+# wheel and drag events of the interaction traces
+ZOOM_STEPS = 5
+DRAG_STEPS = 10
+PAN_DISTANCE = 400
+
+RESULTS_DIRECTORY = "benchmark_results"
+# medians which changed more than this times are marked by comparison
+COMPARE_THRESHOLD = 1.1
+
+
+def synthetic_size(megapixels):
+    # 4:3 frame, as most of the photos are
+    width = round(math.sqrt(megapixels * 1e6 * 4 / 3))
+    return width, round(megapixels * 1e6 / width)
+
+
+def noise(size):
+    # the same seeded tile is repeated, so the image is the same on every machine
+    rng = np.random.default_rng(NOISE_SEED)
+    tile = Image.fromarray(rng.integers(0, 2 * NOISE_AMPLITUDE + 1, (NOISE_TILE, NOISE_TILE), dtype=np.uint8))
+
+    image = Image.new("L", size)
+    for x, y in itertools.product(range(0, size[0], NOISE_TILE), range(0, size[1], NOISE_TILE)):
+        image.paste(tile, (x, y))
+    return image
+
+
+def synthetic_image(mode, megapixels):
+    size = synthetic_size(megapixels)
+    grain = noise(size)
+
+    # every band has its own gradient, so conversions and channel operations don't see a gray image
+    gradient = Image.linear_gradient("L")
+    gradients = (
+        gradient,
+        gradient.transpose(Image.ROTATE_90),
+        gradient.transpose(Image.FLIP_TOP_BOTTOM),
+        Image.radial_gradient("L"),
+    )
+    bands = [
+        ImageChops.add(band.resize(size, Image.BILINEAR), grain, offset=-NOISE_AMPLITUDE)
+        for band in gradients[:len(Image.new(mode, (1, 1)).getbands())]
+    ]
+
+    if mode == "1":
+        return bands[0].convert("1")
+    return bands[0] if len(bands) == 1 else Image.merge(mode, bands)
+
+
+def finish_render(edit):
+    # scheduled renders and refines are run at once, and all tiles are waited for
+    while edit.canvas.jobs or edit.tile_requests:
+        edit.canvas.run_jobs()
+        edit.render_pool.wait()
+
+
+def opened(image, canvas=True):
+    edit = ImageEdit(image)
+    if canvas:
+        edit.set_canvas(FakeCanvas())
+        finish_render(edit)
+    return edit
+
+
+def replay(edit, trace):
+    # events go through the bindings of the editor, as Tk delivers them
+    for sequence, x, y in trace:
+        edit.canvas.event_generate(sequence, x=x, y=y)
+        # Tk runs the due callbacks between two events
+        edit.canvas.run_jobs()
+    finish_render(edit)
+
+
+def drag(start, end, steps=DRAG_STEPS):
+    (x0, y0), (x1, y1) = start, end
+    return [
+        ("<B1-Motion>", x0 + (x1 - x0) * step / steps, y0 + (y1 - y0) * step / steps)
+        for step in range(1, steps + 1)
+    ]
+
+
+def zoom_trace(edit):
+    return [("<Button-4>", CANVAS_WIDTH // 2, CANVAS_HEIGHT // 2)] * ZOOM_STEPS
+
+
+def pan_trace(edit):
+    center = CANVAS_WIDTH // 2, CANVAS_HEIGHT // 2
+    return [("<ButtonPress-1>", *center)] + drag(center, (center[0] - PAN_DISTANCE, center[1] - PAN_DISTANCE))
+
+
+def crop_trace(edit):
+    # selection is dragged by its top left corner to the quarter of image, then moved by its center
+    area = edit._image_area()
+    x0, y0 = area.x0 - edit.canvas.canvasx(0), area.y0 - edit.canvas.canvasy(0)
+    corner = x0 + area.width / 4, y0 + area.height / 4
+    center = x0 + area.width * 5 / 8, y0 + area.height * 5 / 8
+    moved = center[0] - area.width / 8, center[1] - area.height / 8
+
+    trace = [("<Motion>", x0, y0), ("<ButtonPress-1>", x0, y0)] + drag((x0, y0), corner)
+    trace += [("<Motion>", *center), ("<ButtonPress-1>", *center)] + drag(center, moved)
+    return trace
+
+
+def crop_selected(edit):
+    edit.start_crop_selection()
+    replay(edit, crop_trace(edit))
+    edit.crop_selected_area()
+
+
+def render_tiles(image, quality):
+    # all tiles of the fitted image in the calling thread, pyramid level is built before
+    pyramid = ImagePyramid(image)
+    scale = min(CANVAS_WIDTH / pyramid.width, CANVAS_HEIGHT / pyramid.height, 1.0)
+    level = pyramid.level_for_scale(scale)
+    pyramid.level(level)
+    size = max(int(pyramid.width * scale), 1), max(int(pyramid.height * scale), 1)
+
+    def run():
+        for tx, ty in itertools.product(range(-(-size[0] // TILE_SIZE)), range(-(-size[1] // TILE_SIZE))):
+            ImageEdit._render_tile(pyramid, level, scale, size, tx, ty, quality)
+    return run
+
+
+def local_change(image):
+    # one small square is changed, as a brush would do it
+    changed = image.copy()
+    changed.paste(Image.new(image.mode, (64, 64)), (image.width // 2, image.height // 2))
+    return changed
+
+
+def packed(image, mode):
+    keyframe = Keyframe(image.copy())
+    keyframe.pack(mode)
+    return keyframe
+
+
+# benchmark name -> (setup, modes), setup prepares the state and returns the measured function
+BENCHMARKS = {}
+
+EDIT_OPERATIONS = {
+    "rotate(90)": ("rotate", 90),
+    "rotate(45)": ("rotate", 45),
+    "flip(horizontal)": ("flip", operations.FLIPS["horizontal"]),
+    "resize(50)": ("resize", 50),
+    "resize(150)": ("resize", 150),
+    **{f"filter({name})": ("filter", name) for name in operations.FILTERS},
+    **{f"convert({mode})": ("convert", mode) for mode in operations.CONVERT_MODES},
+}
+# channel operations are defined only for RGB images
+RGB_CONVERSIONS = ("roll", "R", "G", "B")
+
+# edits which are undone and redone, rotation is lazy, resize is replayed, filter is restored from pixels
+HISTORY_STEPS = {
+    "rotate": ("rotate", 90),
+    "resize": ("resize", 50),
+    "filter": ("filter", "blur"),
+}
+# replayable operations after the loaded image, their state is computed by replay
+REPLAY_CHAIN = [("rotate", 90), ("crop",), ("flip", operations.FLIPS["vertical"]), ("resize", 80)] * 3
+
+
+def benchmark(name, modes=MODES):
+    def decorator(setup):
+        BENCHMARKS[name] = (setup, modes)
+        return setup
+    return decorator
+
+
+def edited(image, steps):
+    edit = opened(image)
+    for name, *args in steps:
+        if name == "crop":
+            crop_selected(edit)
+        else:
+            getattr(edit, name)(*args)
+    return edit
+
+
+def edit_benchmark(method, *args):
+    def setup(image):
+        edit = opened(image)
+        return lambda: getattr(edit, method)(*args)
+    return setup
+
+
+def undo_benchmark(step):
+    def setup(image):
+        return edited(image, [step]).undo
+    return setup
+
+
+def redo_benchmark(step):
+    def setup(image):
+        return edited(image, [step, ("undo",)]).redo
+    return setup
+
+
+def enhance_benchmark(name, factor=1.5):
+    def setup(image):
+        edit = opened(image)
+        # as the enhance window applies its slider
+        return lambda: edit.set_image(operations.enhance(edit.image, name, factor), "enhance", name, factor)
+    return setup
+
+
+def pack_benchmark(mode):
+    def setup(image):
+        keyframe = Keyframe(image.copy())
+        return lambda: keyframe.pack(mode)
+    return setup
+
+
+def load_benchmark(mode):
+    def setup(image):
+        keyframe = packed(image, mode)
+        return lambda: keyframe.image
+    return setup
+
+
+for name, (method, *args) in EDIT_OPERATIONS.items():
+    modes = ("RGB",) if method == "convert" and args[0] in RGB_CONVERSIONS else MODES
+    benchmark(f"edit.{name}", modes)(edit_benchmark(method, *args))
+for name in operations.ENHANCERS:
+    benchmark(f"edit.enhance({name})")(enhance_benchmark(name))
+for name, step in HISTORY_STEPS.items():
+    benchmark(f"edit.undo({name})")(undo_benchmark(step))
+    benchmark(f"edit.redo({name})")(redo_benchmark(step))
+for mode in ("compress", "spill"):
+    benchmark(f"history.pack({mode})")(pack_benchmark(mode))
+    benchmark(f"history.load({mode})")(load_benchmark(mode))
+
+
+@benchmark("edit.rotate(90).image")
+def rotate_pixels(image):
+    # rotation is lazy, pixels are transposed on the first access
+    edit = opened(image)
+    return lambda: (edit.rotate(90), edit.image)
+
+
+@benchmark("edit.crop")
+def crop(image):
+    edit = opened(image)
+    return lambda: crop_selected(edit)
+
+
+@benchmark("interaction.crop_selection")
+def crop_selection(image):
+    edit = opened(image)
+    edit.start_crop_selection()
+    return lambda: replay(edit, crop_trace(edit))
+
+
+@benchmark("history.push(delta)")
+def push_delta(image):
+    edit = opened(image, canvas=False)
+    changed = local_change(image)
+    return lambda: edit.history.push(changed)
+
+
+@benchmark("history.push(keyframe)")
+def push_keyframe(image):
+    edit = opened(image, canvas=False)
+    changed = operations.flip(image, operations.FLIPS["horizontal"])
+    return lambda: edit.history.push(changed)
+
+
+@benchmark("history.state(replay)")
+def history_replay(image):
+    history = edited(image, REPLAY_CHAIN).history
+    return lambda: history.state(history.current)
+
+
+@benchmark("render.open")
+def render_open(image):
+    edit = opened(image, canvas=False)
+    return lambda: (edit.set_canvas(FakeCanvas()), finish_render(edit))
+
+
+@benchmark("render.zoom")
+def render_zoom(image):
+    edit = opened(image)
+    return lambda: replay(edit, zoom_trace(edit))
+
+
+@benchmark("render.pan")
+def render_pan(image):
+    # zoomed image is larger than the canvas, so panning brings new tiles
+    edit = opened(image)
+    replay(edit, zoom_trace(edit))
+    return lambda: replay(edit, pan_trace(edit))
+
+
+@benchmark("render.rotate(90)")
+def render_rotate(image):
+    edit = opened(image)
+    return lambda: (edit.rotate(90), edit.update_image_on_canvas(), finish_render(edit))
+
+
+@benchmark("render.tiles(preview)")
+def render_preview_tiles(image):
+    return render_tiles(image, PREVIEW_QUALITY)
+
+
+@benchmark("render.tiles(final)")
+def render_final_tiles(image):
+    return render_tiles(image, FINAL_QUALITY)
+
+
+def measure(setup, image, repeat):
+    # every run gets its own state, only the returned function is timed
+    times = []
+    for _ in range(repeat):
+        run = setup(image)
+        gc.collect()
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+        del run
+    return times
+
+
+def run_benchmarks(names, modes, sizes, repeat):
+    results = []
+    for megapixels, mode in itertools.product(sizes, modes):
+        selected = [name for name in names if mode in BENCHMARKS[name][1]]
+        if not selected:
+            continue
+
+        image = synthetic_image(mode, megapixels)
+        for name in selected:
+            result = {"benchmark": name, "mode": mode, "megapixels": megapixels, "size": list(image.size)}
+            try:
+                times = measure(BENCHMARKS[name][0], image, repeat)
+            except (ValueError, OSError) as e:
+                # e.g. filters of "1" images, the failure is kept to be compared too
+                result["error"] = str(e)
+                print(f"{name:<28} {mode:<5} {megapixels:>4} MP  error: {e}")
+            else:
+                median = statistics.median(times)
+                result.update({
+                    "min_s": min(times),
+                    "median_s": median,
+                    "max_s": max(times),
+                    "times_s": times,
+                })
+                print(f"{name:<28} {mode:<5} {megapixels:>4} MP  {median * 1000:12.2f} ms")
+            results.append(result)
+
+        del image
+        gc.collect()
+    return results
+
+
+def git_revision():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+        changes = subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown", False
+    return commit, bool(changes)
+
+
+def environment():
+    return {
+        "python": platform.python_version(),
+        "pillow": PIL.__version__,
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "system": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def save_results(results, repeat, directory):
+    commit, dirty = git_revision()
+    data = {
+        "commit": commit,
+        "dirty": dirty,
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "repeat": repeat,
+        "environment": environment(),
+        "results": results,
+    }
+
+    # one file for every commit, so results of two commits can be compared
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{commit[:12]}{'-dirty' if dirty else ''}.json")
+    with atomic_write(path, 'w') as f:
+        json.dump(data, f, indent=4)
+    return path
+
+
+def load_results(path):
+    with open(path, 'r') as f:
+        data = json.load(f)
+    return {
+        (result["benchmark"], result["mode"], result["megapixels"]): result
+        for result in data["results"]
+    }
+
+
+def compare(old_path, new_path, threshold=COMPARE_THRESHOLD):
+    old, new = load_results(old_path), load_results(new_path)
+    print(f"{'benchmark':<28} {'mode':<5} {'MP':>4} {'old, ms':>12} {'new, ms':>12} {'ratio':>7}")
+
+    changed = 0
+    for key in sorted(old.keys() & new.keys(), key=lambda key: (key[2], key[1], key[0])):
+        if "median_s" not in old[key] or "median_s" not in new[key]:
+            continue
+
+        ratio = new[key]["median_s"] / old[key]["median_s"]
+        mark = ""
+        if ratio > threshold:
+            mark = "slower"
+        elif ratio < 1 / threshold:
+            mark = "faster"
+        changed += bool(mark)
+
+        name, mode, megapixels = key
+        print(
+            f"{name:<28} {mode:<5} {megapixels:>4} "
+            f"{old[key]['median_s'] * 1000:12.2f} {new[key]['median_s'] * 1000:12.2f} {ratio:7.2f} {mark}"
+        )
+    return changed
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Time PyPhotoEditor operations on synthetic images, without display."
+    )
+    parser.add_argument(
+        "-k", "--select", nargs="+", default=["*"], metavar="PATTERN",
+        help="benchmarks to run, shell patterns like 'edit.convert(*'"
+    )
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    parser.add_argument("--sizes", nargs="+", type=int, choices=SIZES, default=list(DEFAULT_SIZES), help="megapixels")
+    parser.add_argument("--repeat", type=int, default=REPEAT, help="runs of every benchmark, median is compared")
+    parser.add_argument("--output", default=RESULTS_DIRECTORY, help="directory for results, a file for every commit")
+    parser.add_argument(
+        "--compare", nargs="+", metavar="RESULTS",
+        help="compare old results with the new ones, or with results of this run if only one file is given"
+    )
+    parser.add_argument("--list", action="store_true", help="show benchmarks and exit")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    names = [name for name in BENCHMARKS if any(fnmatch.fnmatchcase(name, pattern) for pattern in args.select)]
+    if args.list:
+        for name in names:
+            print(name)
+        return 0
+
+    if args.compare and len(args.compare) > 2:
+        print("Only two results can be compared", file=sys.stderr)
+        return 1
+    if args.compare and len(args.compare) == 2:
+        compare(*args.compare)
+        return 0
+
+    if not names:
+        print("No benchmarks match the given patterns", file=sys.stderr)
+        return 1
+
+    results = run_benchmarks(names, args.modes, args.sizes, args.repeat)
+    path = save_results(results, args.repeat, args.output)
+    print(f"Results are saved to '{path}'")
+
+    if args.compare:
+        compare(args.compare[0], path)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
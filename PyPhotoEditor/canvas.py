@@ -0,0 +1,9 @@
+from tkinter import Canvas
+
+from PIL import ImageTk
+
+
+class TkCanvas(Canvas):
+    # canvas of the editor, ImageEdit gets its images through it to be able to draw on a fake one
+    def photo_image(self, image):
+        return ImageTk.PhotoImage(image, master=self)
@@ -47,14 +47,15 @@ class EnhanceSliderWindow(Toplevel):
         self.image_info.update_image_on_canvas()
 
     def apply(self):
-        self.image_info.set_image(self.image_info.image)
+        self.image_info.set_image(self.image_info.image, "enhance", self.name.lower(), self.factor.get())
         self.image_info.unsaved = True
         
         self.update_method(self.image_info)
         self.close()
 
     def cancel(self):
-        self.image_info.set_image(self.original)
+        # image is not changed, so nothing is saved to history
+        self.image_info.image = self.original
         self.image_info.update_image_on_canvas()
 
         self.update_method(self.image_info)
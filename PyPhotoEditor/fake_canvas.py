@@ -0,0 +1,146 @@
+import itertools
+
+# size of the window which the canvas pretends to be
+CANVAS_WIDTH = 1280
+CANVAS_HEIGHT = 800
+
+
+class Event:
+    # fields of tkinter.Event which are read by the editor
+    def __init__(self, x=0, y=0, num=0, delta=0):
+        self.x = x
+        self.y = y
+        self.num = num
+        self.delta = delta
+
+
+class FakeCanvas:
+    # in-memory canvas without display, it keeps coordinates of the items and draws nothing
+    def __init__(self, width=CANVAS_WIDTH, height=CANVAS_HEIGHT):
+        self.width = width
+        self.height = height
+        self.items = {}
+        self.ids = itertools.count(1)
+        # canvas coordinates of the top left corner of the window
+        self.x = 0
+        self.y = 0
+        self.mark = (0, 0, 0, 0)
+        # scheduled callbacks: id -> (fn, args)
+        self.jobs = {}
+        self.bindings = {}
+        self.options = {}
+
+    def winfo_width(self):
+        return self.width
+
+    def winfo_height(self):
+        return self.height
+
+    def canvasx(self, x):
+        return self.x + x
+
+    def canvasy(self, y):
+        return self.y + y
+
+    def _create(self, kind, coords, tags=None, image=None):
+        item = next(self.ids)
+        tags = (tags,) if isinstance(tags, str) else tuple(tags or ())
+        self.items[item] = {"kind": kind, "coords": list(coords), "tags": tags, "image": image}
+        return item
+
+    def create_rectangle(self, x0, y0, x1, y1, tags=None, **options):
+        return self._create("rectangle", (x0, y0, x1, y1), tags)
+
+    def create_image(self, x, y, image=None, tags=None, **options):
+        return self._create("image", (x, y), tags, image)
+
+    def create_text(self, x, y, tags=None, **options):
+        return self._create("text", (x, y), tags)
+
+    def _find(self, tag_or_id):
+        if tag_or_id == "all":
+            return list(self.items)
+        if isinstance(tag_or_id, str):
+            return [item for item, options in self.items.items() if tag_or_id in options["tags"]]
+        return [tag_or_id] if tag_or_id in self.items else []
+
+    def delete(self, tag_or_id):
+        for item in self._find(tag_or_id):
+            del self.items[item]
+
+    def coords(self, item, *coords):
+        if coords:
+            self.items[item]["coords"] = list(coords)
+        return self.items[item]["coords"]
+
+    def bbox(self, item):
+        options = self.items[item]
+        coords = options["coords"]
+        if options["kind"] == "image":
+            x, y = coords
+            return int(x), int(y), int(x) + options["image"].width, int(y) + options["image"].height
+        # Tk adds a pixel around the rectangle
+        return int(coords[0]) - 1, int(coords[1]) - 1, int(coords[2]) + 1, int(coords[3]) + 1
+
+    def scale(self, tag_or_id, x, y, scale_x, scale_y):
+        for item in self._find(tag_or_id):
+            coords = self.items[item]["coords"]
+            coords[0::2] = [x + (cx - x) * scale_x for cx in coords[0::2]]
+            coords[1::2] = [y + (cy - y) * scale_y for cy in coords[1::2]]
+
+    def itemconfigure(self, item, image=None, **options):
+        if image is not None:
+            self.items[item]["image"] = image
+
+    def lower(self, item):
+        pass
+
+    def configure(self, **options):
+        self.options.update(options)
+
+    def __setitem__(self, option, value):
+        self.options[option] = value
+
+    def photo_image(self, image):
+        # tiles stay PIL images, PhotoImage can't be made without Tk
+        return image
+
+    def bind(self, sequence, fn):
+        self.bindings[sequence] = fn
+
+    def unbind(self, sequence):
+        self.bindings.pop(sequence, None)
+
+    def event_generate(self, sequence, x=0, y=0, delta=0):
+        # x and y are window coordinates, as Tk gives them to the handlers
+        fn = self.bindings.get(sequence)
+        if fn is None:
+            return
+        # number of the mouse button, e.g. 4 for "<Button-4>"
+        button = sequence.strip("<>").split("-")[-1]
+        fn(Event(x, y, num=int(button) if button.isdigit() else 0, delta=delta))
+
+    def scan_mark(self, x, y):
+        self.mark = (x, y, self.x, self.y)
+
+    def scan_dragto(self, x, y, gain=10):
+        mark_x, mark_y, start_x, start_y = self.mark
+        self.x = start_x - gain * (x - mark_x)
+        self.y = start_y - gain * (y - mark_y)
+
+    def after(self, ms, fn, *args):
+        job = next(self.ids)
+        self.jobs[job] = (fn, args)
+        return job
+
+    def after_idle(self, fn, *args):
+        return self.after(0, fn, *args)
+
+    def after_cancel(self, job):
+        self.jobs.pop(job, None)
+
+    def run_jobs(self):
+        # due callbacks are run at once, delays are not waited
+        jobs, self.jobs = self.jobs, {}
+        for fn, args in jobs.values():
+            fn(*args)
@@ -0,0 +1,403 @@
+import functools
+import itertools
+import weakref
+
+import numpy as np
+
+from operations import OPERATIONS, REPLAYABLE_OPERATIONS
+import orientation
+from packed_image import PACKERS, image_nbytes
+
+MB = 1024 * 1024
+
+# memory for the undo history of one image and of all opened images together
+HISTORY_MEMORY_LIMIT = 512 * MB
+HISTORY_TOTAL_MEMORY_LIMIT = 2048 * MB
+
+# older keyframes of all images are packed when their bitmaps take more memory
+HISTORY_RAM_LIMIT = 1024 * MB
+# "compress" keeps packed keyframes in memory with zlib, "spill" moves them to temp files
+HISTORY_PACK_MODE = "compress"
+
+# every n-th operation in a row is stored as a full bitmap to keep replays short
+KEYFRAME_INTERVAL = 16
+
+# local edits are stored as the changed tiles only, while they change not more than this part of image
+DELTA_TILE_SIZE = 64
+DELTA_MAX_CHANGED = 0.5
+
+# operations which change every pixel, their results are stored as keyframes without comparison
+WHOLE_IMAGE_OPERATIONS = {"filter", "convert", "enhance"}
+
+class Keyframe:
+    # age of the entry among the entries of all histories
+    _stamps = itertools.count()
+
+    def __init__(self, image, operation=None):
+        self._image = image
+        # operation which made this state from the previous one, if it is known
+        self.operation = operation
+        self.packed = None
+        self.nbytes = image_nbytes(image)
+        self.stamp = next(self._stamps)
+
+    @property
+    def resident(self):
+        return self._image is not None
+
+    @property
+    def image(self):
+        if self._image is not None:
+            return self._image
+        # packed keyframe is loaded back on every replay, so it doesn't grow memory again
+        return self.packed.load()
+
+    def pack(self, mode):
+        self.set_packed(PACKERS[mode](self._image))
+
+    def set_packed(self, packed):
+        # packed copy may be made in another thread, the bitmap is only dropped here
+        self.packed = packed
+        self._image = None
+        self.nbytes = packed.nbytes
+
+
+class Operation:
+    nbytes = 0
+
+    def __init__(self, name, *args):
+        if name not in OPERATIONS:
+            raise ValueError(f"Unknown operation '{name}'")
+
+        self.name = name
+        self.args = args
+
+    def apply(self, image):
+        return OPERATIONS[self.name](image, *self.args)
+
+
+class Delta:
+    def __init__(self, tiles):
+        # [((x, y), tile image), ...], the rest is taken from the previous state
+        self.tiles = tiles
+        self.operation = None
+        self.nbytes = sum(image_nbytes(tile) for _, tile in tiles)
+
+    @classmethod
+    def between(cls, parent, image):
+        if parent.mode != image.mode or parent.size != image.size:
+            return None
+        if parent.mode in ("P", "PA") and parent.getpalette() != image.getpalette():
+            return None
+
+        rows, columns = -(-image.height // DELTA_TILE_SIZE), -(-image.width // DELTA_TILE_SIZE)
+        max_changed = DELTA_MAX_CHANGED * rows * columns
+
+        tiles = []
+        for y in range(0, image.height, DELTA_TILE_SIZE):
+            # one row of tiles is compared at a time, so memory doesn't grow with the image
+            box = (0, y, image.width, min(y + DELTA_TILE_SIZE, image.height))
+            changed = changed_tiles(np.asarray(parent.crop(box)), np.asarray(image.crop(box)), DELTA_TILE_SIZE)[0]
+
+            for tx in np.nonzero(changed)[0]:
+                x = int(tx) * DELTA_TILE_SIZE
+                tiles.append(((x, y), image.crop([x, y, x + DELTA_TILE_SIZE, y + DELTA_TILE_SIZE])))
+            # too much of the image is changed, it is stored as keyframe
+            if len(tiles) > max_changed:
+                return None
+        return cls(tiles)
+
+    def apply(self, image):
+        image = image.copy()
+        for position, tile in self.tiles:
+            image.paste(tile, position)
+        return image
+
+
+def changed_tiles(a, b, tile_size):
+    diff = a != b
+    if diff.ndim == 3:
+        diff = diff.any(axis=2)
+
+    height, width = diff.shape
+    rows, columns = -(-height // tile_size), -(-width // tile_size)
+
+    padded = np.zeros((rows * tile_size, columns * tile_size), dtype=bool)
+    padded[:height, :width] = diff
+    return padded.reshape(rows, tile_size, columns, tile_size).any(axis=(1, 3))
+
+
+class HistoryMemory:
+    def __init__(self, image_limit=HISTORY_MEMORY_LIMIT, total_limit=HISTORY_TOTAL_MEMORY_LIMIT,
+                 ram_limit=HISTORY_RAM_LIMIT, pack_mode=HISTORY_PACK_MODE):
+        self.image_limit = image_limit
+        self.total_limit = total_limit
+        self.ram_limit = ram_limit
+        self.pack_mode = pack_mode
+        self.histories = weakref.WeakSet()
+        # pool which packs keyframes in background, without it they are packed right away
+        self.pool = None
+        self.packing = weakref.WeakSet()
+
+    def register(self, history):
+        self.histories.add(history)
+
+    def unregister(self, history):
+        self.histories.discard(history)
+
+    @property
+    def nbytes(self):
+        return sum(history.nbytes for history in self.histories)
+
+    def pack(self):
+        # keyframes which are already being packed will leave memory soon
+        keyframes = [
+            (history, keyframe)
+            for history in self.histories
+            for keyframe in history.packable_keyframes()
+            if keyframe not in self.packing
+        ]
+        # current states are not counted, they stay in memory anyway
+        resident = sum(keyframe.nbytes for _, keyframe in keyframes)
+
+        for history, keyframe in sorted(keyframes, key=lambda entry: entry[1].stamp):
+            if resident <= self.ram_limit:
+                break
+            resident -= keyframe.nbytes
+
+            if self.pool is None:
+                keyframe.pack(self.pack_mode)
+                continue
+            self.packing.add(keyframe)
+            self.pool.submit(
+                PACKERS[self.pack_mode], keyframe.image,
+                callback=functools.partial(self.packed, history, keyframe),
+                errback=lambda error, keyframe=keyframe: self.packing.discard(keyframe)
+            )
+
+    def packed(self, history, keyframe, packed):
+        self.packing.discard(keyframe)
+        # keyframe may be shown again, dropped or spilled by eviction while it was packed
+        if keyframe in history.packable_keyframes():
+            keyframe.set_packed(packed)
+
+    def enforce(self):
+        self.pack()
+
+        for history in self.histories:
+            history.enforce_limit()
+
+        total = self.nbytes
+
+        while total > self.total_limit:
+            # the oldest keyframe which the current state of its image doesn't depend on
+            candidates = [history for history in self.histories if history.can_drop_oldest()]
+            if not candidates:
+                break
+
+            oldest = min(candidates, key=lambda history: history.entries[0].stamp)
+            total -= oldest.drop_oldest()
+
+
+history_memory = HistoryMemory()
+
+
+class History:
+    def __init__(self, image, memory=history_memory):
+        self.memory = memory
+        self.entries = [Keyframe(image)]
+        self.current = 0
+        self.image = image
+        # bitmap which the editor keeps for its lazy rotations and flips, image is None while they are pending
+        self.source = image
+        # state which is written in the file, None if it is not in history anymore
+        self.saved = 0
+        # operations of the states which were dropped, recipe still starts from the loaded image
+        self.dropped_operations = []
+
+        self.memory.register(self)
+
+    @property
+    def nbytes(self):
+        return sum(entry.nbytes for entry in self.entries)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def push(self, image, operation=None):
+        # operation is kept only to describe the edit, the state is restored from pixels
+        delta = None
+        whole_image = operation is not None and operation.name in WHOLE_IMAGE_OPERATIONS
+        if self.image is not None and not whole_image and not self._needs_keyframe():
+            delta = Delta.between(self.image, image)
+
+        if delta is None:
+            self._append(Keyframe(image, operation), image)
+        else:
+            delta.operation = operation
+            self._append(delta, image)
+
+    def push_operation(self, image, name, *args):
+        if name not in REPLAYABLE_OPERATIONS:
+            raise ValueError(f"Operation '{name}' can't be replayed")
+
+        # image is None when the editor applies the operation lazily
+        if image is not None and self._needs_keyframe():
+            # result is already computed, so it becomes a keyframe for free
+            self._append(Keyframe(image, Operation(name, *args)), image)
+        else:
+            self._append(Operation(name, *args), image)
+
+    def _needs_keyframe(self):
+        return self.current - self._keyframe_index(self.current) + 1 >= KEYFRAME_INTERVAL
+
+    def _append(self, entry, image):
+        # new state drops all states which could be redone
+        del self.entries[self.current + 1:]
+        if self.saved is not None and self.saved > self.current:
+            self.saved = None
+
+        self.entries.append(entry)
+        self.current = len(self.entries) - 1
+        self.image = image
+
+        self.memory.enforce()
+
+    def enforce_limit(self):
+        nbytes = self.nbytes
+        while nbytes > self.memory.image_limit and self.can_drop_oldest():
+            nbytes -= self.drop_oldest()
+
+    def packable_keyframes(self):
+        return [
+            entry for entry in self.entries
+            if isinstance(entry, Keyframe) and entry.resident
+            and entry.image is not self.image and entry.image is not self.source
+        ]
+
+    def _keyframe_index(self, index):
+        while not isinstance(self.entries[index], Keyframe):
+            index -= 1
+        return index
+
+    def _next_keyframe_index(self):
+        for index in range(1, len(self.entries)):
+            if isinstance(self.entries[index], Keyframe):
+                return index
+        return None
+
+    def can_drop_oldest(self):
+        index = self._next_keyframe_index()
+        return index is not None and index <= self.current
+
+    def drop_oldest(self):
+        # keyframe is dropped together with the operations replayed from it
+        index = self._next_keyframe_index()
+        dropped = self.entries[:index]
+        self.dropped_operations.extend(self.operation(i) for i in range(1, index + 1))
+
+        del self.entries[:index]
+        self.current -= index
+        if self.saved is not None:
+            self.saved = self.saved - index if self.saved >= index else None
+        return sum(entry.nbytes for entry in dropped)
+
+    def state(self, index):
+        keyframe = self._keyframe_index(index)
+
+        image = self.entries[keyframe].image
+        # rotations and flips in a row are replayed as one transpose
+        pending = 1
+        for entry in self.entries[keyframe + 1:index + 1]:
+            operation = entry if isinstance(entry, Operation) else None
+            transform = None if operation is None else orientation.from_operation(operation.name, *operation.args)
+            if transform is not None:
+                pending = orientation.compose(pending, transform)
+                continue
+
+            image = entry.apply(orientation.transpose(image, pending))
+            pending = 1
+        return orientation.transpose(image, pending)
+
+    def operation(self, index):
+        # operation which made the state from the previous one, None if it is not known
+        entry = self.entries[index]
+        return entry if isinstance(entry, Operation) else entry.operation
+
+    def operations(self):
+        # all operations from the loaded image to the current state, None if some of them is not known
+        operations = self.dropped_operations + [self.operation(index) for index in range(1, self.current + 1)]
+        return None if None in operations else operations
+
+    def can_undo(self):
+        # if there are no previous state in history (we are at start point)
+        return self.current >= 1
+
+    def can_redo(self):
+        # if there are no next state (we are at the end)
+        return self.current < len(self.entries) - 1
+
+    def undo(self, replay=True):
+        # without replay the caller knows the new state, it is given back by restore
+        if not self.can_undo():
+            return None
+
+        self.current -= 1
+        self.image = self.state(self.current) if replay else None
+        return self.image
+
+    def redo(self, replay=True):
+        if not self.can_redo():
+            return None
+
+        self.current += 1
+        entry = self.entries[self.current]
+        if not replay:
+            self.image = None
+        elif isinstance(entry, Keyframe):
+            self.image = entry.image
+        elif self.image is not None:
+            # next operation can be applied right to the current state
+            self.image = entry.apply(self.image)
+        else:
+            self.image = self.state(self.current)
+        return self.image
+
+    def mark_saved(self):
+        self.saved = self.current
+
+    def operations_since_saved(self):
+        # operations which turn the saved state into the current one, None if some of them is not known
+        if self.saved is None or self.saved > self.current:
+            return None
+
+        operations = [self.operation(index) for index in range(self.saved + 1, self.current + 1)]
+        return None if None in operations else operations
+
+    def nbytes_without(self, image):
+        # memory which is taken by history besides the given current image
+        return sum(
+            entry.nbytes for entry in self.entries
+            if not (isinstance(entry, Keyframe) and entry.resident and entry.image is image)
+        )
+
+    def evict(self):
+        # resident keyframes with their bitmaps, which the caller spills to disk, current image is given back by restore
+        keyframes = [
+            (entry, entry.image) for entry in self.entries
+            if isinstance(entry, Keyframe) and entry.resident
+        ]
+        self.image = None
+        self.source = None
+        return keyframes
+
+    def restore(self, image):
+        self.image = image
+
+    def close(self):
+        self.entries.clear()
+        self.current = 0
+        self.image = None
+        self.source = None
+        self.saved = None
+        self.memory.unregister(self)
@@ -1,18 +1,74 @@
-from PIL import Image, ImageTk, ImageOps, ImageFilter, ImageEnhance
-import numpy as np
+from PIL import Image, ImageOps, ImageFilter, ImageEnhance
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+import operations
+import orientation
 from coordinates import Rect
+from history import History, Operation, image_nbytes
+from image_pyramid import ImagePyramid
+from profiler import profiled
+from tile_cache import TileCache
+from worker_pool import TkWorkerPool
 
-HISTORY_SIZE = 10
+TILE_SIZE = 256
+# minimal time between two renders of the viewport, ms
+RENDER_FRAME_BUDGET = 16
+# idle time after the last drag or wheel event before the final quality render, ms
+REFINE_DELAY = 200
+
+PREVIEW_QUALITY = 0
+FINAL_QUALITY = 1
+
+# tiles of all opened images are resampled by the same threads, PIL releases GIL while resizing
+RENDER_WORKERS = os.cpu_count() or 1
+render_executor = ThreadPoolExecutor(max_workers=RENDER_WORKERS, thread_name_prefix="render")
+
+
+def image_pixels(edit, *args, **kwargs):
+    return edit.pyramid.width * edit.pyramid.height
+
+
+def visible_pixels(edit, *args, **kwargs):
+    return edit.canvas.winfo_width() * edit.canvas.winfo_height()
+
+
+def state_nbytes(result, edit, *args, **kwargs):
+    # bitmap of the new state, lazy rotations and flips don't make any
+    return image_nbytes(edit._image) if edit._image is not None else 0
 
 
 class ImageEdit:
-    def __init__(self, image):
-        self.original_image = image
-        self.image = image.copy()
+    def __init__(self, image=None):
+        self.original_image = None
+        self._image = None
+        # current image is the source with pending orientation, which is applied when pixels are needed
+        self.source = None
+        self.orientation = 1
+        self.pyramid = None
+        self.tile_cache = TileCache()
+        self.history = None
 
         self.canvas = None
         self.zoom_container = None
-        self.image_container = None
+        self.placeholder = None
+        self.placeholder_tk = None
+        # called when the shown proxy has not enough resolution for the current zoom
+        self.full_image_needed = None
+        # canvas items of the shown tiles: (tile x, tile y) -> (item, PhotoImage, quality)
+        self.tile_items = {}
+        self.tiles_layout = None
+        # tiles being rendered in background: (tile x, tile y) -> (future, quality)
+        self.tile_requests = {}
+        self.render_pool = None
+
+        self.frame_budget = RENDER_FRAME_BUDGET
+        self.render_job = None
+        self.last_render_time = 0.0
+
+        # fast preview while dragging or zooming, final quality when idle
+        self.interacting = False
+        self.refine_job = None
 
         self.imscale = 1.0
         self.zoom_delta = 1.3
@@ -23,76 +79,163 @@ class ImageEdit:
         self.sel_move_x = 0
         self.sel_move_y = 0
 
-        self.history = [self.image]
-        self.current_history_point = 0
+        if image is not None:
+            self.load_image(image)
+
+    @property
+    def loaded(self):
+        return self.history is not None
+
+    @property
+    def has_proxy(self):
+        return not self.loaded and self.pyramid is not None
+
+    def load_image(self, original, image=None):
+        # image is the working copy of original, it can be prepared by the loading thread
+        self.original_image = original
+        self.image = image if image is not None else original.copy()
+        self.history = History(self.image)
+
+        if self.canvas is None:
+            return
+
+        # full image replaces the shown proxy at the same zoom and position
+        if self.zoom_container is not None:
+            self.update_image_on_canvas()
+        else:
+            self._show_image()
+
+    def load_proxy(self, proxy, size, level):
+        # reduced copy of the not yet decoded image, it is shown as pyramid level but can't be edited
+        self.pyramid = ImagePyramid(proxy, base_level=level, size=size)
+        self.tile_cache = TileCache()
+
+        if self.canvas is not None:
+            self._show_image()
+
+    @property
+    def image(self):
+        if self._image is None and self.loaded and self.pyramid is not None:
+            # render threads don't need it, only edits and saves transpose the whole image
+            self._image = orientation.transpose(self.source, self.orientation)
+            self.history.restore(self._image)
+        return self._image
+
+    @image.setter
+    def image(self, image):
+        self._image = image
+        self.source = image
+        self.orientation = 1
+        if self.history is not None:
+            # history must not pack the bitmap which is still shown
+            self.history.source = image
+        # levels and tiles are built lazily on the first render of the new image
+        self.pyramid = ImagePyramid(image)
+        self.tile_cache = TileCache()
+
+    def orient(self, transform):
+        # chain of rotations and flips costs nothing until the pixels are needed
+        self.orientation = orientation.compose(self.orientation, transform)
+        self._image = None
+        self.pyramid = self.pyramid.oriented(self.orientation)
+        self.tile_cache = TileCache()
 
     @property
     def image_tk(self):
-        return ImageTk.PhotoImage(self.image)
+        return self.canvas.photo_image(self.image)
 
     def set_canvas(self, canvas):
+        # TkCanvas of the editor or FakeCanvas without display, images are made by the canvas
         self.canvas = canvas
+        self.render_pool = TkWorkerPool(canvas, executor=render_executor)
+
+        if self.loaded:
+            self._show_image()
+        else:
+            self.placeholder = self.canvas.create_text(
+                self.canvas.winfo_width() // 2, self.canvas.winfo_height() // 2, text="Loading..."
+            )
+
+    def set_placeholder(self, thumbnail):
+        # not decoded image shows its thumbnail instead of the loading text
+        if self.loaded or self.has_proxy or self.canvas is None:
+            return
+
+        self.canvas.delete(self.placeholder)
+        self.placeholder_tk = self.canvas.photo_image(thumbnail)
+        self.placeholder = self.canvas.create_image(
+            self.canvas.winfo_width() // 2, self.canvas.winfo_height() // 2, image=self.placeholder_tk
+        )
+
+    def _show_image(self):
+        if self.placeholder is not None:
+            self.canvas.delete(self.placeholder)
+            self.placeholder = None
+            self.placeholder_tk = None
+
         self._bind_zoom()
-        self.zoom_container = self.canvas.create_rectangle(0, 0, self.image.width, self.image.height, width=0)
+        # resized canvas may show tiles which were not visible before
+        self.canvas.bind("<Configure>", lambda event: self._schedule_render())
+        # image which is larger than the canvas is opened to fit in it
+        width, height = self.pyramid.size
+        canvas_width, canvas_height = self.canvas.winfo_width(), self.canvas.winfo_height()
+        if canvas_width > 1 and canvas_height > 1:
+            self.imscale = min(canvas_width / width, canvas_height / height, 1.0)
+
+        self.zoom_container = self.canvas.create_rectangle(
+            0, 0, width * self.imscale, height * self.imscale, width=0
+        )
         self._show_zoomed_image()
 
     def update_image_on_canvas(self):
         if self.canvas is None:
             raise RuntimeError("Canvas of image not given")
         
+        self._cancel_render()
         self._show_zoomed_image()
 
+    @profiled("rotate", pixels=image_pixels, nbytes=state_nbytes)
     def rotate(self, degrees):
-        self.image = self.image.rotate(degrees, expand=True)
+        transform = orientation.from_rotation(degrees)
+        if transform is not None:
+            self.orient(transform)
+        else:
+            self.image = operations.rotate(self.image, degrees)
         self.canvas.delete("all")
         self._reset_scale()
-        self.save_to_history()
+        self.save_operation_to_history("rotate", degrees)
 
+    @profiled("flip", pixels=image_pixels, nbytes=state_nbytes)
     def flip(self, mode):
-        self.image = self.image.transpose(mode)
-        self.save_to_history()
+        transform = orientation.from_transpose(mode)
+        if transform is not None:
+            self.orient(transform)
+        else:
+            self.image = operations.flip(self.image, mode)
+        self.save_operation_to_history("flip", mode)
 
+    @profiled("resize", pixels=image_pixels, nbytes=state_nbytes)
     def resize(self, percents):
-        w, h = self.image.size
-        w = (w * percents) // 100
-        h = (h * percents) // 100
-
-        self.image = self.image.resize((w, h), Image.ANTIALIAS)
+        self.image = operations.resize(self.image, percents)
 
         self._reset_scale()
-        self.save_to_history()
+        self.save_operation_to_history("resize", percents)
 
-    def filter(self, filter_type):
-        self.image = self.image.filter(filter_type)
-        self.save_to_history()
+    @profiled("filter", pixels=image_pixels, nbytes=state_nbytes)
+    def filter(self, name):
+        self.image = operations.apply_filter(self.image, name)
+        self.save_to_history("filter", name)
 
+    @profiled("convert", pixels=image_pixels, nbytes=state_nbytes)
     def convert(self, mode):
-        if mode == "roll":
-            if self.image.mode != "RGB":
-                raise ValueError(f"Can't roll image with not RGB mode '{self.image.mode}'")
-            
-            self.image = Image.fromarray(np.array(self.image)[:,:,::-1])
-            return
-        elif mode in "R G B".split(' '):
-            if self.image.mode != "RGB":
-                raise ValueError(f"Can't split channel of image with not RGB mode '{self.image.mode}'")
-
-            a = np.array(self.image)
-            a[:,:,(mode!="R", mode!="G", mode!="B")] *= 0
-            self.image = Image.fromarray(a)
-            return
-        
-        try:
-            self.image = self.image.convert(mode)
-            self.save_to_history()
-        except ValueError as e:
-            raise ValueError(f"Conversion error: '{e}'")
+        self.image = operations.convert(self.image, mode)
+        self.save_to_history("convert", mode)
 
     def start_crop_selection(self):
         self._unbind_zoom()
 
-        bbox = self.canvas.bbox(self.image_container)
-        self.crop_selection = Rect(*bbox, side_offset=5)
+        image = self._image_area()
+        self.crop_selection = Rect(*image.coordinates, side_offset=5)
 
         self.sel_rect = self.canvas.create_rectangle(
             *self.crop_selection.coordinates,
@@ -154,8 +297,7 @@ class ImageEdit:
         x = self.canvas.canvasx(event.x)
         y = self.canvas.canvasy(event.y)
 
-        bbox = self.canvas.bbox(self.image_container)
-        image = Rect(*bbox)
+        image = self._image_area()
 
         if self.sel_change_side == "topleft":
             x = max(x, image.x0)
@@ -253,23 +395,23 @@ class ImageEdit:
         self.canvas.coords(self.sel_rect, *self.crop_selection.coordinates)
 
     def _set_crop_area_on_full_image(self, event):
-        bbox = self.canvas.bbox(self.image_container)
-        self.crop_selection = Rect(*bbox, side_offset=5)
-        self.canvas.coords(self.sel_rect, *bbox)
+        image = self._image_area()
+        self.crop_selection = Rect(*image.coordinates, side_offset=5)
+        self.canvas.coords(self.sel_rect, *image.coordinates)
 
     def _start_crop_area_movement(self, event):
         if self.sel_change_side == "center":
             self.sel_move_x = self.canvas.canvasx(event.x)
             self.sel_move_y = self.canvas.canvasy(event.y)
 
+    @profiled("crop", pixels=image_pixels, nbytes=state_nbytes)
     def crop_selected_area(self):
         if self.sel_rect is None:
             raise ValueError("Got no selection area for Crop operation")
         
         self._unbind_crop()
 
-        bbox = self.canvas.bbox(self.image_container)
-        image = Rect(*bbox)
+        image = self._image_area()
 
         dx0 = (self.crop_selection.x0 - image.x0) / image.width
         dx1 = (image.width - (image.x1 - self.crop_selection.x1)) / image.width
@@ -289,9 +431,10 @@ class ImageEdit:
             self._bind_zoom()
             return
         
-        self.image = self.image.crop([x0, y0, x1, y1])
+        # history keeps fractions, so the exported recipe crops images of other sizes the same way
+        self.image = operations.crop_fraction(self.image, [dx0, dy0, dx1, dy1])
         self._reset_scale()
-        self.save_to_history()
+        self.save_operation_to_history("crop_fraction", [dx0, dy0, dx1, dy1])
 
         self.crop_selection = None
         self._bind_zoom()
@@ -311,9 +454,11 @@ class ImageEdit:
     def get_enhancer(self, enhacer):
         return enhacer(self.image)
     
-    def set_image(self, image):
+    @profiled("set_image", pixels=image_pixels, nbytes=state_nbytes)
+    def set_image(self, image, *operation):
+        # operation which made the image, if it can be repeated by batch processing
         self.image = image
-        self.save_to_history()
+        self.save_to_history(*operation)
 
     def _bind_zoom(self):
         self.canvas.bind("<ButtonPress-1>", self._move_from)
@@ -334,14 +479,18 @@ class ImageEdit:
 
         cx, cy = self.canvas.canvasx(0), self.canvas.canvasy(0)
         self.canvas.delete(self.zoom_container)
-        self.zoom_container = self.canvas.create_rectangle(cx, cy, self.image.width + cx, self.image.height + cy, width=0)
+        self.zoom_container = self.canvas.create_rectangle(
+            cx, cy, self.pyramid.width + cx, self.pyramid.height + cy, width=0
+        )
+        self._clear_tiles()
 
     def _move_from(self, event):
         self.canvas.scan_mark(event.x, event.y)
     
     def _move_to(self, event):
         self.canvas.scan_dragto(event.x, event.y, gain=1)
-        self._show_zoomed_image()
+        self._start_interaction()
+        self._schedule_render()
 
     def _zoom_with_wheel(self, event):
         x = self.canvas.canvasx(event.x)
@@ -357,7 +506,7 @@ class ImageEdit:
         # event.num - Linux, event.delta - Windows
         if event.num == 5 or event.delta == -120:
             # scroll down
-            i = min(self.image.width, self.image.height)
+            i = min(self.pyramid.width, self.pyramid.height)
             # image is less than 30 pixels
             if int(i * self.imscale) < 30:
                 return
@@ -375,9 +524,45 @@ class ImageEdit:
 
         # rescale all canvas objects
         self.canvas.scale('all', x, y, scale, scale)
+        self._start_interaction()
+        self._schedule_render()
+
+    def _start_interaction(self):
+        self.interacting = True
+
+        if self.refine_job is not None:
+            self.canvas.after_cancel(self.refine_job)
+        self.refine_job = self.canvas.after(REFINE_DELAY, self._finish_interaction)
+
+    def _finish_interaction(self):
+        self.refine_job = None
+        self.interacting = False
+        # re-render preview tiles of the visible area in final quality
+        self._schedule_render()
+
+    def _schedule_render(self):
+        # view is already marked as dirty, render will pick up the latest state
+        if self.render_job is not None:
+            return
+
+        elapsed = (time.perf_counter() - self.last_render_time) * 1000
+        delay = int(self.frame_budget - elapsed)
+        if delay > 0:
+            self.render_job = self.canvas.after(delay, self._render_scheduled)
+        else:
+            self.render_job = self.canvas.after_idle(self._render_scheduled)
+
+    def _cancel_render(self):
+        if self.render_job is not None:
+            self.canvas.after_cancel(self.render_job)
+            self.render_job = None
+
+    def _render_scheduled(self):
+        self.render_job = None
+        self.last_render_time = time.perf_counter()
         self._show_zoomed_image()
 
-    def _show_zoomed_image(self, event=None):
+    def _image_area(self):
         bbox = self.canvas.bbox(self.zoom_container)
         rect = Rect(*bbox)
         # Remove 1 pixel at the sides of bbox
@@ -385,6 +570,15 @@ class ImageEdit:
         rect.y0 += 1
         rect.x1 -= 1
         rect.y1 -= 1
+        return rect
+
+    @profiled("show_zoomed_image", pixels=visible_pixels)
+    def _show_zoomed_image(self, event=None):
+        # pixels of inactive tab were evicted, shown tiles stay until it is restored
+        if self.pyramid is None:
+            return
+
+        rect = self._image_area()
 
         # get visible area
         visible = Rect(
@@ -409,68 +603,201 @@ class ImageEdit:
 
         self.canvas.configure(scrollregion=scroll.coordinates)
 
-        # get coordinates of the image tile
-        tile = Rect(
-            max(scroll.x0 - rect.x0, 0), max(scroll.y0 - rect.y0, 0),
-            min(scroll.x1, rect.x1) - rect.x0,
-            min(scroll.y1, rect.y1) - rect.y0
-        )
-
-        # show image if it is in the visible area
-        if tile.width > 0 and tile.height > 0:
-            x = min(int(tile.x1 / self.imscale), self.image.width)
-            y = min(int(tile.y1 / self.imscale), self.image.height)
-
-            image = self.image.crop([int(tile.x0 / self.imscale), int(tile.y0 / self.imscale), x, y])
-            imagetk = ImageTk.PhotoImage(image.resize([int(tile.width), int(tile.height)]))
-
-            if self.image_container is not None:
-                self.canvas.delete(self.image_container)
-            
-            self.image_container = self.canvas.create_image(
-                max(scroll.x0, rect.x0), max(scroll.y0, rect.y0),
-                anchor='nw', image=imagetk
+        # shown tiles are valid only while image, position and scale are the same
+        layout = (self.pyramid, rect.x0, rect.y0, self.imscale)
+        if layout != self.tiles_layout:
+            self._clear_tiles()
+            self.tiles_layout = layout
+
+        visible_tiles = self._visible_tiles(rect, visible)
+
+        # panning: forget tiles which went out of the visible area
+        for position in list(self.tile_items):
+            if position not in visible_tiles:
+                item, _, _ = self.tile_items.pop(position)
+                self.canvas.delete(item)
+
+        # and don't waste render threads on them
+        for position in list(self.tile_requests):
+            if position not in visible_tiles:
+                future, _ = self.tile_requests.pop(position)
+                future.cancel()
+
+        quality = PREVIEW_QUALITY if self.interacting else FINAL_QUALITY
+
+        # draw only the tiles which came into view or are of lower quality
+        level = self.pyramid.level_for_scale(self.imscale)
+        size = self._zoomed_size()
+
+        if self.pyramid.proxy and self.imscale > self.pyramid.level_scale(level):
+            # proxy is upscaled until the full image is decoded
+            if self.full_image_needed is not None:
+                self.full_image_needed()
+        for tx, ty in visible_tiles:
+            shown = self.tile_items.get((tx, ty))
+            if shown is not None and shown[2] >= quality:
+                continue
+
+            cached = self._get_cached_tile(level, tx, ty, quality)
+            if cached is not None:
+                self._show_tile(rect, tx, ty, *cached)
+                continue
+
+            requested = self.tile_requests.get((tx, ty))
+            if requested is not None:
+                if requested[1] >= quality:
+                    continue
+                requested[0].cancel()
+
+            future = self.render_pool.submit(
+                self._render_tile, self.pyramid, level, self.imscale, size, tx, ty, quality,
+                callback=lambda tile, args=(layout, level, tx, ty, quality): self._tile_rendered(tile, *args)
             )
+            self.tile_requests[(tx, ty)] = (future, quality)
 
-            # set image into background
-            self.canvas.lower(self.image_container)
-            # keep extra reference to prevent garbage-collection
-            self.canvas.imagetk = imagetk
+    def _tile_rendered(self, tile, layout, level, tx, ty, quality):
+        # image, position or scale were changed while the tile was rendered
+        if layout != self.tiles_layout:
+            return
 
-    def save_to_history(self):
-        if self.current_history_point != len(self.history) - 1:
-            del self.history[self.current_history_point + 1:]
+        requested = self.tile_requests.get((tx, ty))
+        if requested is None or requested[1] != quality:
+            return
+        del self.tile_requests[(tx, ty)]
 
-        if len(self.history) == HISTORY_SIZE:
-            del self.history[0]
+        imagetk = self.canvas.photo_image(tile)
+        self.tile_cache.put((level, self.imscale, quality, tx, ty), imagetk)
 
-        self.history.append(self.image)
-        self.current_history_point = len(self.history) - 1
+        self._show_tile(self._image_area(), tx, ty, imagetk, quality)
 
+    def _show_tile(self, rect, tx, ty, imagetk, quality):
+        shown = self.tile_items.get((tx, ty))
+        if shown is not None:
+            item = shown[0]
+            self.canvas.itemconfigure(item, image=imagetk)
+        else:
+            item = self.canvas.create_image(
+                rect.x0 + tx * TILE_SIZE, rect.y0 + ty * TILE_SIZE,
+                anchor='nw', image=imagetk, tags="tile"
+            )
+            # set tile into background
+            self.canvas.lower(item)
+        # keep extra reference to prevent garbage-collection
+        self.tile_items[(tx, ty)] = (item, imagetk, quality)
+
+    def _get_cached_tile(self, level, tx, ty, quality):
+        # final quality tile is always better than preview one, if it is already rendered
+        for cached_quality in (FINAL_QUALITY, quality):
+            imagetk = self.tile_cache.get((level, self.imscale, cached_quality, tx, ty))
+            if imagetk is not None:
+                return imagetk, cached_quality
+        return None
+
+    def _zoomed_size(self):
+        return max(int(self.pyramid.width * self.imscale), 1), max(int(self.pyramid.height * self.imscale), 1)
+
+    def _visible_tiles(self, rect, visible):
+        width, height = self._zoomed_size()
+
+        x0 = max(int((visible.x0 - rect.x0) // TILE_SIZE), 0)
+        y0 = max(int((visible.y0 - rect.y0) // TILE_SIZE), 0)
+        x1 = min(int((visible.x1 - rect.x0) // TILE_SIZE), (width - 1) // TILE_SIZE)
+        y1 = min(int((visible.y1 - rect.y0) // TILE_SIZE), (height - 1) // TILE_SIZE)
+
+        return {(tx, ty) for tx in range(x0, x1 + 1) for ty in range(y0, y1 + 1)}
+
+    @staticmethod
+    @profiled(
+        "render_tile", result_pixels=lambda tile: tile.width * tile.height,
+        nbytes=lambda tile, *args: image_nbytes(tile)
+    )
+    def _render_tile(pyramid, level, imscale, size, tx, ty, quality):
+        # runs in a render thread, so it must not touch the canvas or the current state
+        width, height = size
+
+        source = pyramid.level(level)
+        level_width, level_height = orientation.oriented_size(source.size, pyramid.orientation)
+        scale = imscale / pyramid.level_scale(level)
+
+        x0, y0 = tx * TILE_SIZE, ty * TILE_SIZE
+        x1, y1 = min(x0 + TILE_SIZE, width), min(y0 + TILE_SIZE, height)
+
+        # resample only the part of the level under the tile
+        box = (
+            x0 / scale, y0 / scale,
+            min(x1 / scale, level_width), min(y1 / scale, level_height)
+        )
+        # which is taken from the stored pixels and turned to the shown orientation
+        box = orientation.source_box(box, source.size, pyramid.orientation)
+        tile_size = orientation.oriented_size((x1 - x0, y1 - y0), pyramid.orientation)
+
+        if quality == FINAL_QUALITY:
+            resample = Image.LANCZOS
+        elif scale > 1:
+            resample = Image.NEAREST
+        else:
+            resample = Image.BOX
+
+        tile = source.resize(tile_size, resample, box=box)
+        return orientation.transpose(tile, pyramid.orientation)
+
+    def _clear_tiles(self):
+        for item, _, _ in self.tile_items.values():
+            self.canvas.delete(item)
+        self.tile_items.clear()
+
+        for future, _ in self.tile_requests.values():
+            future.cancel()
+        self.tile_requests.clear()
+        self.tiles_layout = None
+
+    def save_to_history(self, *operation):
+        self.history.push(self.image, Operation(*operation) if operation else None)
+
+    def save_operation_to_history(self, name, *args):
+        # not yet transposed image is not given, history keeps only the operation then
+        self.history.push_operation(self._image, name, *args)
+
+    def recipe(self):
+        # steps which turn the loaded image into the current one, None if some edit is not known
+        history = self.history.operations()
+        if history is None:
+            return None
+        return [(operation.name, operation.args) for operation in history]
+
+    def _orientation_change(self, index):
+        operation = self.history.operation(index)
+        if operation is None:
+            return None
+        return orientation.from_operation(operation.name, *operation.args)
+
+    @profiled("undo", pixels=image_pixels, nbytes=state_nbytes)
     def undo(self):
-        # if has no history yet
-        if len(self.history) < 2:
-            return False
-        # if there are no previous state in history (we are at start point)
-        if self.current_history_point < 1:
+        if not self.history.can_undo():
             return False
 
-        self.current_history_point -= 1
-        self.image = self.history[self.current_history_point]
+        # rotation or flip is undone by the inverse one, without replay of history
+        transform = self._orientation_change(self.history.current)
+        if transform is not None:
+            self.history.undo(replay=False)
+            self.orient(orientation.inverse(transform))
+        else:
+            self.image = self.history.undo()
 
         self._reset_scale()
         return True
 
+    @profiled("redo", pixels=image_pixels, nbytes=state_nbytes)
     def redo(self):
-        # if has no history yet
-        if len(self.history) < 2:
-            return False
-        # if there are no next state (we are at the end)
-        if self.current_history_point == len(self.history) - 1:
+        if not self.history.can_redo():
             return False
 
-        self.current_history_point += 1
-        self.image = self.history[self.current_history_point]
+        transform = self._orientation_change(self.history.current + 1)
+        if transform is not None:
+            self.history.redo(replay=False)
+            self.orient(transform)
+        else:
+            self.image = self.history.redo()
 
         self._reset_scale()
         return True
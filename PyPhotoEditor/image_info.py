@@ -1,16 +1,151 @@
+import concurrent.futures
+import functools
 import shutil
 from tkinter import filedialog as fd
 from PIL import Image
 from image_edit import ImageEdit
+from image_loader import decode_image
+from image_saver import write_image, write_jpeg_orientation
+from history import image_nbytes
+from packed_image import SpilledImage
+from tile_cache import TileCache
+import orientation
 import os
 
 
+def spill_images(image, keyframes):
+    # runs in a loader thread, the bitmaps are only read here
+    load = None
+    if image is not None:
+        try:
+            load = SpilledImage(image).load
+        except OSError:
+            # changed image which can't be written to disk stays in memory
+            load = lambda: image
+
+    spilled = []
+    for keyframe, bitmap in keyframes:
+        try:
+            spilled.append((keyframe, SpilledImage(bitmap)))
+        except OSError:
+            break
+    return load, spilled
+
+
 class ImageInfo(ImageEdit):
     def __init__(self, image, path, tab):
         super().__init__(image)
 
         self.path = path
         self.tab = tab
+
+        # dormant image keeps only its thumbnail until it is loaded
+        self.loading = False
+        self.thumbnail = None
+        # edits which were requested while only the proxy was shown
+        self.waiting_commands = []
+
+        # evicted image keeps its history on disk, its pixels are in the file or spilled
+        self.evicted = False
+        self.spill_job = None
+        # changed image which is kept until it is spilled, so a restore can cancel the spill
+        self.evicted_image = None
+        self.spilled_orientation = 1
+
+        # number of writes of this image which are still encoded in background, and the last of them
+        self.saving = 0
+        self.last_save = None
+
+    @property
+    def dormant(self) -> bool:
+        return not self.loaded and not self.loading and not self.has_proxy
+
+    def load_image(self, original, image=None):
+        self.loading = False
+        # full image was already decoded by the edit which couldn't wait for the loader
+        if self.loaded:
+            return
+        self.thumbnail = None
+        super().load_image(original, image)
+
+    @property
+    def nbytes(self):
+        nbytes = image_nbytes(self.source) + self.history.nbytes_without(self.source)
+        # transposed copy of the source, if it was needed
+        if self._image is not None and self._image is not self.source:
+            nbytes += image_nbytes(self._image)
+        if self.original_image is not None:
+            nbytes += image_nbytes(self.original_image)
+        return nbytes
+
+    def evict(self, pool):
+        # clean image is read back from its file, changed one and history are spilled to temp files by the pool
+        image = self.source if self.unsaved else None
+        self.evicted_image = image
+        self.spilled_orientation = self.orientation
+        self.spill_job = pool.submit(spill_images, image, self.history.evict(), callback=self.spilled)
+
+        self._cancel_render()
+        for future, _ in self.tile_requests.values():
+            future.cancel()
+        self.tile_requests.clear()
+
+        self.original_image = None
+        self._image = None
+        self.source = None
+        self.orientation = 1
+        self.pyramid = None
+        self.tile_cache = TileCache()
+        self.evicted = True
+
+    def spilled(self, result):
+        self.evicted_image = None
+        _, keyframes = result
+        for keyframe, packed in keyframes:
+            # keyframe may be packed or shown again while it was written
+            if keyframe.resident and keyframe.image is not self.history.image \
+                    and keyframe.image is not self.history.source:
+                keyframe.set_packed(packed)
+
+    def read_evicted_image(self, spill_job):
+        # runs in a loader thread, spill was submitted to the same pool before, so it is already running or done
+        load, _ = spill_job.result()
+        if load is not None:
+            return None, orientation.transpose(load(), self.spilled_orientation)
+        return decode_image(self.full_path(no_star=True))
+
+    def read_evicted_image_now(self):
+        # runs in the Tk thread, spill which is still queued behind other jobs is cancelled instead of waited for
+        if not self.spill_job.cancel():
+            return self.read_evicted_image(self.spill_job)
+
+        if self.evicted_image is not None:
+            return None, orientation.transpose(self.evicted_image, self.spilled_orientation)
+        return decode_image(self.full_path(no_star=True))
+
+    def restore(self, original, image):
+        if not self.evicted:
+            return
+
+        self.evicted = False
+        self.spill_job = None
+        self.evicted_image = None
+        self.spilled_orientation = 1
+        self.loading = False
+
+        self.original_image = original
+        self.image = image
+        self.history.restore(image)
+
+        if self.canvas is not None:
+            self.update_image_on_canvas()
+
+    def set_thumbnail(self, thumbnail):
+        if self.loaded:
+            return
+
+        self.thumbnail = thumbnail
+        self.set_placeholder(thumbnail)
     
     @property
     def unsaved(self) -> bool:
@@ -39,10 +174,47 @@ class ImageInfo(ImageEdit):
         return self.path[:-1] if no_star and self.path[-1] == '*' else self.path
 
     def save(self):
+        job = self.save_job()
+        if job is not None:
+            job()
+
+    def save_job(self):
+        # current state is captured now, so the returned job can encode it in another thread
         if not self.unsaved:
-            return
+            return None
+        transform = self.lossless_transform()
+
         self.unsaved = False
-        self.image.save(self.path)
+        self.history.mark_saved()
+        if transform is not None:
+            return functools.partial(write_jpeg_orientation, self.path, transform)
+        return functools.partial(write_image, self.image, self.path)
+
+    def lossless_transform(self):
+        # orientation which turns the saved JPEG into the current image, if nothing else was changed
+        file_format = Image.registered_extensions().get(self.file_extension(no_star=True).lower())
+        if self.saving or file_format != "JPEG":
+            return None
+
+        operations = self.history.operations_since_saved()
+        if operations is None:
+            return None
+
+        transform = 1
+        for operation in operations:
+            step = orientation.from_operation(operation.name, *operation.args)
+            if step is None:
+                return None
+            transform = orientation.compose(transform, step)
+        return transform
+
+    def save_failed(self):
+        self.unsaved = True
+        # file may not be in the state which was marked as saved
+        self.history.saved = None
+
+    def title(self):
+        return f"{self.filename()} (saving...)" if self.saving else self.filename()
 
     def save_as(self):
         old_ext = self.file_extension(no_star=True)
@@ -59,17 +231,32 @@ class ImageInfo(ImageEdit):
         elif new_ext != old_ext:
             raise ValueError(f"Got incorrect extension: '{new_ext}'. Old was '{old_ext}'")
         
-        self.image.save(new_path + new_ext)
+        write_image(self.image, new_path + new_ext)
         self.image.close()
 
         self.path = new_path + new_ext
         self.unsaved = False
+        self.history.mark_saved()
 
         self.image = Image.open(self.path)
 
+    def wait_for_saves(self):
+        # queued writes still encode the bitmaps and write the file
+        if self.last_save is not None:
+            concurrent.futures.wait([self.last_save])
+
     def close(self):
-        self.image.close()
-        self.original_image.close()
+        self.wait_for_saves()
+        if not self.loaded:
+            return
+
+        self.history.close()
+        if self.evicted:
+            return
+
+        self.source.close()
+        if self.original_image is not None:
+            self.original_image.close()
 
     def delete(self):
         self.close()
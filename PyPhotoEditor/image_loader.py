@@ -0,0 +1,60 @@
+import math
+import os
+
+from PIL import Image
+
+import orientation
+from packed_image import image_nbytes
+from profiler import profiled
+
+LOADER_WORKERS = os.cpu_count() or 1
+THUMBNAIL_SIZE = 256
+
+
+@profiled(
+    "decode_image", result_pixels=lambda images: images[1].width * images[1].height,
+    nbytes=lambda images, *args: image_nbytes(images[0]) + image_nbytes(images[1])
+)
+def decode_image(path):
+    # runs in a loader thread: whole decoding happens here, not on the first render
+    image = Image.open(path)
+    image.load()
+    image = orientation.upright(image)
+    return image, image.copy()
+
+
+@profiled(
+    "decode_proxy", result_pixels=lambda proxy: proxy[0].width * proxy[0].height if proxy else 0,
+    nbytes=lambda proxy, *args: image_nbytes(proxy[0]) if proxy else 0
+)
+def decode_proxy(path, display_size):
+    image = Image.open(path)
+    file_orientation = orientation.exif_orientation(image)
+    stored_size = image.size
+    full_size = stored_size[::-1] if orientation.swaps_axes(file_orientation) else stored_size
+
+    # fit the whole image into the display, as it is shown when opened
+    scale = min(display_size[0] / full_size[0], display_size[1] / full_size[1], 1.0)
+    # only JPEG can be decoded at 1/2, 1/4 or 1/8 of its size, draft does nothing for other formats
+    image.draft(image.mode, (int(stored_size[0] * scale), int(stored_size[1] * scale)))
+
+    if image.size == stored_size:
+        image.close()
+        return None
+
+    image.load()
+    level = round(math.log2(stored_size[0] / image.width))
+    return orientation.transpose(image, file_orientation), full_size, level
+
+
+@profiled(
+    "decode_thumbnail", result_pixels=lambda thumbnail: thumbnail.width * thumbnail.height,
+    nbytes=lambda thumbnail, *args: image_nbytes(thumbnail)
+)
+def decode_thumbnail(path):
+    with Image.open(path) as image:
+        file_orientation = orientation.exif_orientation(image)
+        # JPEG is decoded right at the reduced size
+        image.draft("RGB", (THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+        image.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+        return orientation.transpose(image, file_orientation).copy()
@@ -0,0 +1,77 @@
+import copy
+import math
+import threading
+
+from PIL import Image
+
+import orientation as orientations
+
+# smallest side of the last pyramid level
+PYRAMID_MIN_SIZE = 64
+
+
+class ImagePyramid:
+    def __init__(self, image, min_size=PYRAMID_MIN_SIZE, base_level=0, size=None, orientation=1):
+        self.min_size = min_size
+        # base image can be a reduced proxy of the full image, then it is the level base_level
+        self.base_level = base_level
+        # levels keep the stored pixels, tiles are turned to the shown orientation when rendered
+        self.orientation = orientation
+        self.source_size = size if size is not None else image.size
+        self.levels = [image]
+        # levels can be requested from several render threads at once
+        self.lock = threading.Lock()
+
+        side = min(self.source_size)
+        self.depth = 1 + int(math.log2(side / min_size)) if side > min_size else 1
+        self.depth = max(self.depth, base_level + 1)
+
+    @property
+    def size(self):
+        return orientations.oriented_size(self.source_size, self.orientation)
+
+    @property
+    def width(self):
+        return self.size[0]
+
+    @property
+    def height(self):
+        return self.size[1]
+
+    @property
+    def proxy(self):
+        return self.base_level > 0
+
+    @staticmethod
+    def level_scale(level):
+        return 1 / (1 << level)
+
+    def level_for_scale(self, scale):
+        if scale >= 1.0:
+            return self.base_level
+
+        # the smallest level which is still not less than the requested scale
+        level = int(math.floor(math.log2(1 / scale) + 1e-9))
+        return max(min(level, self.depth - 1), self.base_level)
+
+    def level(self, level):
+        index = max(min(level, self.depth - 1), self.base_level) - self.base_level
+        if index < len(self.levels) and index > 0:
+            return self.levels[index]
+
+        with self.lock:
+            # opened image is decoded only once, by the first thread which needs it
+            self.levels[0].load()
+
+            while len(self.levels) <= index:
+                previous = self.levels[-1]
+                size = (max(previous.width // 2, 1), max(previous.height // 2, 1))
+                self.levels.append(previous.resize(size, Image.BOX))
+
+            return self.levels[index]
+
+    def oriented(self, orientation):
+        # the same levels are shown in another orientation, nothing is resampled again
+        pyramid = copy.copy(self)
+        pyramid.orientation = orientation
+        return pyramid
@@ -0,0 +1,48 @@
+import concurrent.futures
+import os
+
+from PIL import Image
+
+from atomic_file import atomic_write
+import jpeg_exif
+import orientation
+from profiler import profiled
+
+# encoders release GIL, so several images are written at the same time
+SAVER_WORKERS = os.cpu_count() or 1
+
+
+def image_format(path):
+    ext = os.path.splitext(path)[1].lower()
+    formats = Image.registered_extensions()
+    if ext not in formats:
+        raise ValueError(f"Unknown image extension: '{ext}'")
+    return formats[ext]
+
+
+@profiled("save", pixels=lambda image, path: image.width * image.height)
+def write_image(image, path):
+    # format can't be guessed from the name of the temp file
+    format_name = image_format(path)
+    with atomic_write(path) as f:
+        image.save(f, format=format_name)
+
+
+@profiled("save_jpeg_orientation")
+def write_jpeg_orientation(path, transform):
+    # pixels are not decoded and encoded again, only EXIF orientation of the file is changed
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    new_orientation = orientation.compose(jpeg_exif.get_orientation(data), transform)
+    data = jpeg_exif.set_orientation(data, new_orientation)
+
+    with atomic_write(path) as f:
+        f.write(data)
+
+
+def write_after(previous, job):
+    # writes of one file are done in the order they were requested
+    if previous is not None:
+        concurrent.futures.wait([previous])
+    job()
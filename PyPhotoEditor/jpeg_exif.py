@@ -0,0 +1,103 @@
+from PIL import Image
+
+from orientation import ORIENTATION_TAG, TRANSPOSES
+
+SOI = b"\xff\xd8"
+APP0 = 0xE0
+APP1 = 0xE1
+SOS = 0xDA
+EXIF_HEADER = b"Exif\x00\x00"
+SHORT = 3
+
+
+def _segments(data):
+    # (marker, start, end) of the header segments, compressed data after start of scan is not read
+    if data[:2] != SOI:
+        raise ValueError("Not a JPEG file")
+
+    position = 2
+    while position + 4 <= len(data):
+        if data[position] != 0xFF:
+            raise ValueError("Broken JPEG segment")
+        marker = data[position + 1]
+        # fill bytes before marker
+        if marker == 0xFF:
+            position += 1
+            continue
+
+        end = position + 2 + int.from_bytes(data[position + 2:position + 4], "big")
+        yield marker, position, end
+        if marker == SOS:
+            return
+        position = end
+
+
+def _exif_segment(data):
+    for marker, start, end in _segments(data):
+        if marker == APP1 and data[start + 4:start + 10] == EXIF_HEADER:
+            return start, end
+    return None
+
+
+def _orientation_entry(data, start, end):
+    # position and byte order of the orientation value in the first IFD of EXIF segment
+    tiff = start + 10
+    order = "little" if data[tiff:tiff + 2] == b"II" else "big"
+
+    ifd = tiff + int.from_bytes(data[tiff + 4:tiff + 8], order)
+    if ifd + 2 > end:
+        return None
+
+    count = int.from_bytes(data[ifd:ifd + 2], order)
+    for entry in range(ifd + 2, min(ifd + 2 + count * 12, end - 11), 12):
+        tag = int.from_bytes(data[entry:entry + 2], order)
+        kind = int.from_bytes(data[entry + 2:entry + 4], order)
+        if tag == ORIENTATION_TAG and kind == SHORT:
+            return entry + 8, order
+    return None
+
+
+def get_orientation(data):
+    segment = _exif_segment(data)
+    if segment is None:
+        return 1
+
+    entry = _orientation_entry(data, *segment)
+    if entry is None:
+        return 1
+
+    position, order = entry
+    orientation = int.from_bytes(data[position:position + 2], order)
+    return orientation if orientation in TRANSPOSES else 1
+
+
+def set_orientation(data, orientation):
+    segment = _exif_segment(data)
+
+    if segment is not None:
+        entry = _orientation_entry(data, *segment)
+        if entry is not None:
+            # existing tag is patched in place, the rest of file stays byte for byte the same
+            position, order = entry
+            data = bytearray(data)
+            data[position:position + 2] = orientation.to_bytes(2, order)
+            return bytes(data)
+
+    # there is no tag to patch, so EXIF segment is written anew with it
+    exif = Image.Exif()
+    if segment is not None:
+        exif.load(data[segment[0] + 4:segment[1]])
+    exif[ORIENTATION_TAG] = orientation
+
+    payload = exif.tobytes()
+    if len(payload) + 2 > 0xFFFF:
+        raise ValueError("EXIF data doesn't fit into JPEG segment")
+    new_segment = bytes([0xFF, APP1]) + (len(payload) + 2).to_bytes(2, "big") + payload
+
+    if segment is not None:
+        start, end = segment
+    else:
+        # EXIF goes right after JFIF header, if there is one
+        first = next(_segments(data))
+        start = end = first[2] if first[0] == APP0 else 2
+    return data[:start] + new_segment + data[end:]
@@ -0,0 +1,151 @@
+from PIL import Image, ImageFilter, ImageEnhance
+import numpy as np
+
+# operations don't depend on tkinter, so they are used by the editor and by batch processing
+FLIPS = {
+    "horizontal": Image.FLIP_LEFT_RIGHT,
+    "vertical": Image.FLIP_TOP_BOTTOM,
+}
+
+FILTERS = {
+    "blur": ImageFilter.BLUR,
+    "sharpen": ImageFilter.SHARPEN,
+    "contour": ImageFilter.CONTOUR,
+    "detail": ImageFilter.DETAIL,
+    "smooth": ImageFilter.SMOOTH,
+}
+
+CONVERT_MODES = {
+    "1": "Black and white",
+    "L": "Grayscale",
+    "RGB": "RGB",
+    "RGBA": "RGBA",
+    "CMYK": "CMYK",
+    "LAB": "LAB",
+    "HSV": "HSV",
+    "roll": "Roll RGB colors",
+    "R": "Red",
+    "G": "Green",
+    "B": "Blue",
+}
+
+ENHANCERS = {
+    "color": ImageEnhance.Color,
+    "contrast": ImageEnhance.Contrast,
+    "brightness": ImageEnhance.Brightness,
+    "sharpness": ImageEnhance.Sharpness,
+}
+
+
+def rotate(image, degrees):
+    return image.rotate(degrees, expand=True)
+
+
+def flip(image, mode):
+    return image.transpose(mode)
+
+
+def resize(image, percents):
+    w, h = image.size
+    w = (w * percents) // 100
+    h = (h * percents) // 100
+
+    return image.resize((w, h), Image.LANCZOS)
+
+
+def crop(image, box):
+    x0, y0, x1, y1 = box
+    if not (0 <= x0 < x1 <= image.width and 0 <= y0 < y1 <= image.height):
+        raise ValueError(f"Crop box {list(box)} is out of image {image.width}x{image.height}")
+    return image.crop(box)
+
+
+def crop_fraction(image, box):
+    # box is given in fractions of the size, so a recipe crops images of any size the same way
+    x0, y0, x1, y1 = box
+    return crop(image, [
+        int(x0 * image.width), int(y0 * image.height),
+        int(x1 * image.width), int(y1 * image.height),
+    ])
+
+
+def apply_filter(image, name):
+    return image.filter(FILTERS[name])
+
+
+def convert(image, mode):
+    if mode == "roll":
+        if image.mode != "RGB":
+            raise ValueError(f"Can't roll image with not RGB mode '{image.mode}'")
+
+        return Image.fromarray(np.array(image)[:,:,::-1])
+    elif mode in "R G B".split(' '):
+        if image.mode != "RGB":
+            raise ValueError(f"Can't split channel of image with not RGB mode '{image.mode}'")
+
+        a = np.array(image)
+        a[:,:,(mode!="R", mode!="G", mode!="B")] *= 0
+        return Image.fromarray(a)
+
+    try:
+        return image.convert(mode)
+    except ValueError as e:
+        raise ValueError(f"Conversion error: '{e}'")
+
+
+def enhance(image, name, factor):
+    return ENHANCERS[name](image).enhance(factor)
+
+
+# operations which are cheap to recompute, so history keeps only their parameters
+REPLAYABLE_OPERATIONS = {
+    "rotate": rotate,
+    "flip": flip,
+    "resize": resize,
+    "crop": crop,
+    "crop_fraction": crop_fraction,
+}
+
+# all operations by name, with arguments which can be given in command line
+OPERATIONS = {
+    "rotate": rotate,
+    "flip": flip,
+    "resize": resize,
+    "crop": crop,
+    "crop_fraction": crop_fraction,
+    "filter": apply_filter,
+    "convert": convert,
+    "enhance": enhance,
+}
+
+
+RECIPE_VERSION = 1
+
+
+def recipe_to_dict(steps):
+    # recipe is a list of (operation name, args), flips are written by their names
+    flip_names = {mode: name for name, mode in FLIPS.items()}
+    return {
+        "version": RECIPE_VERSION,
+        "steps": [
+            {"operation": name, "args": [flip_names[args[0]]] if name == "flip" else list(args)}
+            for name, args in steps
+        ],
+    }
+
+
+def recipe_from_dict(data):
+    if data.get("version") != RECIPE_VERSION:
+        raise ValueError(f"Unsupported recipe version: '{data.get('version')}'")
+
+    steps = []
+    for step in data["steps"]:
+        name, args = step["operation"], tuple(step.get("args", ()))
+        if name not in OPERATIONS:
+            raise ValueError(f"Unknown operation in recipe: '{name}'")
+        if name == "flip":
+            if args[0] not in FLIPS:
+                raise ValueError(f"Unknown flip in recipe: '{args[0]}'")
+            args = (FLIPS[args[0]],)
+        steps.append((name, args))
+    return steps
@@ -0,0 +1,110 @@
+from PIL import Image
+
+ORIENTATION_TAG = 0x0112
+
+# EXIF orientation -> transpose which turns the stored pixels into the shown image
+TRANSPOSES = {
+    1: None,
+    2: Image.FLIP_LEFT_RIGHT,
+    3: Image.ROTATE_180,
+    4: Image.FLIP_TOP_BOTTOM,
+    5: Image.TRANSPOSE,
+    6: Image.ROTATE_270,
+    7: Image.TRANSVERSE,
+    8: Image.ROTATE_90,
+}
+
+# point of the shown image -> point of the stored pixels of size w x h
+SOURCE_POINTS = {
+    1: lambda x, y, w, h: (x, y),
+    2: lambda x, y, w, h: (w - x, y),
+    3: lambda x, y, w, h: (w - x, h - y),
+    4: lambda x, y, w, h: (x, h - y),
+    5: lambda x, y, w, h: (y, x),
+    6: lambda x, y, w, h: (y, h - x),
+    7: lambda x, y, w, h: (w - y, h - x),
+    8: lambda x, y, w, h: (w - y, x),
+}
+
+# rotation by the given degrees counterclockwise, as Image.rotate does it
+ROTATIONS = {0: 1, 90: 8, 180: 3, 270: 6}
+
+
+def transpose(image, orientation):
+    method = TRANSPOSES[orientation]
+    return image if method is None else image.transpose(method)
+
+
+def swaps_axes(orientation):
+    return orientation in (5, 6, 7, 8)
+
+
+def oriented_size(size, orientation):
+    return size[::-1] if swaps_axes(orientation) else size
+
+
+def source_box(box, size, orientation):
+    # box of the shown image mapped to the stored pixels, size is the size of stored image
+    x0, y0, x1, y1 = box
+    xs, ys = zip(*(SOURCE_POINTS[orientation](x, y, *size) for x, y in ((x0, y0), (x1, y1))))
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+def _compose_table():
+    # every orientation is checked on a small image with distinct pixels
+    probe = Image.frombytes("L", (3, 2), bytes(range(6)))
+    results = {
+        (image.size, image.tobytes()): orientation
+        for orientation, image in ((o, transpose(probe, o)) for o in TRANSPOSES)
+    }
+
+    table = {}
+    for first in TRANSPOSES:
+        for second in TRANSPOSES:
+            image = transpose(transpose(probe, first), second)
+            table[(first, second)] = results[(image.size, image.tobytes())]
+    return table
+
+
+_COMPOSED = _compose_table()
+
+
+def compose(first, second):
+    # orientation which gives the same result as applying first and then second
+    return _COMPOSED[(first, second)]
+
+
+def inverse(orientation):
+    for other in TRANSPOSES:
+        if compose(orientation, other) == 1:
+            return other
+
+
+def from_rotation(degrees):
+    return ROTATIONS.get(degrees % 360)
+
+
+def from_transpose(method):
+    for orientation, orientation_method in TRANSPOSES.items():
+        if orientation_method == method:
+            return orientation
+    return None
+
+
+def from_operation(name, *args):
+    # orientation of a history operation, None if it changes more than orientation
+    if name == "rotate":
+        return from_rotation(*args)
+    if name == "flip":
+        return from_transpose(*args)
+    return None
+
+
+def exif_orientation(image):
+    orientation = image.getexif().get(ORIENTATION_TAG, 1)
+    return orientation if orientation in TRANSPOSES else 1
+
+
+def upright(image):
+    # image is shown as EXIF orientation says, like other viewers show it
+    return transpose(image, exif_orientation(image))
@@ -0,0 +1,88 @@
+import atexit
+import mmap
+import os
+import shutil
+import tempfile
+import weakref
+import zlib
+
+from PIL import Image
+
+# fast compression level, history snapshots are packed while user is editing
+COMPRESSION_LEVEL = 1
+
+# single band modes which keep more than one byte per pixel
+WIDE_MODES = {"I": 4, "F": 4, "I;16": 2, "I;16L": 2, "I;16B": 2, "I;16N": 2}
+
+_spill_directory = None
+
+
+def image_nbytes(image):
+    if image.mode in WIDE_MODES:
+        pixel_size = WIDE_MODES[image.mode]
+    else:
+        # PIL keeps every multiband pixel in 4 bytes
+        pixel_size = 1 if len(image.getbands()) == 1 else 4
+    return image.width * image.height * pixel_size
+
+
+def spill_directory():
+    global _spill_directory
+
+    if _spill_directory is None:
+        _spill_directory = tempfile.mkdtemp(prefix="pyphotoeditor-history-")
+        atexit.register(shutil.rmtree, _spill_directory, ignore_errors=True)
+    return _spill_directory
+
+
+class PackedImage:
+    def __init__(self, image):
+        self.mode = image.mode
+        self.size = image.size
+        # raw bytes don't keep the palette of "P" images
+        self.palette = image.getpalette() if image.mode in ("P", "PA") else None
+
+    def _unpack(self, data):
+        image = Image.frombytes(self.mode, self.size, data)
+        if self.palette is not None:
+            image.putpalette(self.palette)
+        return image
+
+
+class CompressedImage(PackedImage):
+    def __init__(self, image):
+        super().__init__(image)
+        self.data = zlib.compress(image.tobytes(), COMPRESSION_LEVEL)
+
+    @property
+    def nbytes(self):
+        return len(self.data)
+
+    def load(self):
+        return self._unpack(zlib.decompress(self.data))
+
+
+class SpilledImage(PackedImage):
+    # spilled data lives on disk and takes no memory
+    nbytes = 0
+
+    def __init__(self, image):
+        super().__init__(image)
+
+        fd, self.path = tempfile.mkstemp(suffix=".raw", dir=spill_directory())
+        with os.fdopen(fd, 'wb') as f:
+            f.write(image.tobytes())
+
+        # file is removed as soon as the history entry is dropped
+        weakref.finalize(self, os.remove, self.path)
+
+    def load(self):
+        with open(self.path, 'rb') as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                return self._unpack(data)
+
+
+PACKERS = {
+    "compress": CompressedImage,
+    "spill": SpilledImage,
+}
@@ -0,0 +1,56 @@
+from tkinter import *
+from tkinter.ttk import Treeview
+
+from profiler import profiler
+
+# summary key, heading, width
+COLUMNS = [
+    ("operation", "Operation", 140),
+    ("calls", "Calls", 60),
+    ("wall_total_ms", "Total, ms", 90),
+    ("wall_mean_ms", "Mean, ms", 80),
+    ("wall_p50_ms", "p50, ms", 80),
+    ("wall_p90_ms", "p90, ms", 80),
+    ("wall_p99_ms", "p99, ms", 80),
+    ("wall_max_ms", "Max, ms", 80),
+    ("cpu_mean_ms", "CPU mean, ms", 90),
+    ("mpixels_per_s", "MPix/s", 70),
+    ("bitmaps_max_kb", "Bitmaps, KB", 90),
+]
+
+
+class PerformanceWindow(Toplevel):
+    def __init__(self, root):
+        super().__init__(root)
+
+        self.init()
+
+        self.table = Treeview(self, columns=[key for key, _, _ in COLUMNS], show="headings")
+        for key, heading, width in COLUMNS:
+            self.table.heading(key, text=heading)
+            self.table.column(key, width=width, anchor="w" if key == "operation" else "e")
+
+        self.refresh_button = Button(self, text="Refresh", command=self.refresh)
+        self.close_button = Button(self, text="Close", command=self.close)
+
+        self.draw_widgets()
+        self.refresh()
+
+    def init(self):
+        self.title("Performance")
+
+    def draw_widgets(self):
+        self.table.pack(fill="both", expand=1, pady=5, padx=5)
+        self.refresh_button.pack(side="left", padx=5, pady=5, expand=1)
+        self.close_button.pack(side="left", padx=5, pady=5, expand=1)
+
+    def refresh(self):
+        self.table.delete(*self.table.get_children())
+
+        # the slowest operations in total are at the top
+        for summary in profiler.summary():
+            values = [summary[key] for key, _, _ in COLUMNS]
+            self.table.insert("", "end", values=[f"{v:.2f}" if isinstance(v, float) else v for v in values])
+
+    def close(self):
+        self.destroy()
@@ -2,24 +2,66 @@ from tkinter import *
 from tkinter import filedialog as fd
 from tkinter import messagebox as mb
 from tkinter.ttk import Notebook
-from PIL import Image, ImageFilter, ImageEnhance
+from PIL import Image
+import functools
 import os
 import pyperclip
 import json
 
+from canvas import TkCanvas
 from image_info import ImageInfo
+from operations import CONVERT_MODES, ENHANCERS, FILTERS, recipe_to_dict
+from image_loader import decode_image, decode_proxy, decode_thumbnail, LOADER_WORKERS
+from image_saver import SAVER_WORKERS, write_after
+from worker_pool import TkWorkerPool
+from atomic_file import atomic_write
+from tab_memory import TabMemory, TABS_MEMORY_LIMIT
 from enhance_slider_window import EnhanceSliderWindow
+from performance_window import PerformanceWindow
+from profiler import profiler
+from packed_image import PACKERS
+from history import (
+    history_memory, MB,
+    HISTORY_MEMORY_LIMIT, HISTORY_TOTAL_MEMORY_LIMIT, HISTORY_RAM_LIMIT, HISTORY_PACK_MODE
+)
 
 
 CONFIG_FILE = "config.json"
 
 
+def config_limit(config, key, default):
+    # limit is written in MB, a missing or wrong value falls back to the default
+    value = config.get(key)
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or value <= 0:
+        return default
+    return int(value * MB)
+
+
+def needs_full_image(command):
+    # edit of a tab which shows only the proxy is repeated when the full image is decoded in background
+    @functools.wraps(command)
+    def wrapper(self, *args):
+        image = self.current_image(decode=False)
+        if image is not None and image.has_proxy:
+            image.waiting_commands.append(lambda: wrapper(self, *args))
+            self.load_full_image_in_background(image)
+            return
+        command(self, *args)
+    return wrapper
+
+
 class PyPhotoEditor:
     def __init__(self):
         self.root = Tk()
         self.image_tabs = Notebook(self.root)
         self.opened_images = []
         self.last_viewed_images = []
+        self.config = {}
+        self.loader = TkWorkerPool(self.root, max_workers=LOADER_WORKERS)
+        self.tab_memory = TabMemory(self.loader)
+        # old keyframes are compressed or spilled by the loader, so edits don't wait for it
+        history_memory.pool = self.loader
+        self.saver = TkWorkerPool(self.root, max_workers=SAVER_WORKERS)
 
         self.init()
 
@@ -32,10 +74,21 @@ class PyPhotoEditor:
 
         self.root.bind("<Escape>", self._close)
         self.root.protocol("WM_DELETE_WINDOW", self._close)
+        # restored tabs are laid out at once, so proxies are decoded for the real size of canvas
+        self.image_tabs.pack(fill="both", expand=1)
 
         if not os.path.exists(CONFIG_FILE):
-            with open(CONFIG_FILE, 'w') as f:
-                json.dump({"opened_images": [], "last_viewed_images": []}, f)
+            self.config = {
+                "opened_images": [],
+                "last_viewed_images": [],
+                "history_memory_limit_mb": HISTORY_MEMORY_LIMIT // MB,
+                "history_total_memory_limit_mb": HISTORY_TOTAL_MEMORY_LIMIT // MB,
+                "history_ram_limit_mb": HISTORY_RAM_LIMIT // MB,
+                "history_pack_mode": HISTORY_PACK_MODE,
+                "tabs_memory_limit_mb": TABS_MEMORY_LIMIT // MB
+            }
+            with atomic_write(CONFIG_FILE, 'w') as f:
+                json.dump(self.config, f, indent=4)
         else:
             self.load_images_from_config()
 
@@ -103,35 +156,24 @@ class PyPhotoEditor:
         resize_menu.add_command(label="200% of original size", command=lambda: self.resize_current_image(200))
 
         filter_menu = Menu(edit_menu, tearoff=0)
-        filter_menu.add_command(label="Blur", command=lambda: self.apply_filter_to_current_image(ImageFilter.BLUR))
-        filter_menu.add_command(label="Sharpen", command=lambda: self.apply_filter_to_current_image(ImageFilter.SHARPEN))
-        filter_menu.add_command(label="Contour", command=lambda: self.apply_filter_to_current_image(ImageFilter.CONTOUR))
-        filter_menu.add_command(label="Detail", command=lambda: self.apply_filter_to_current_image(ImageFilter.DETAIL))
-        filter_menu.add_command(label="Smooth", command=lambda: self.apply_filter_to_current_image(ImageFilter.SMOOTH))
+        for name in FILTERS:
+            filter_menu.add_command(label=name.capitalize(), command=lambda x=name: self.apply_filter_to_current_image(x))
 
         crop_menu = Menu(edit_menu, tearoff=0)
         crop_menu.add_command(label="Start selection", command=self.start_crop_selection_of_current_image)
         crop_menu.add_command(label="Crop selected", command=self.crop_selection_of_current_image)
         crop_menu.add_command(label="Cancel", command=self.cancel_selection_of_current_image)
 
+        # menus are built from the tables of operations, which are also used by batch processing
         convert_menu = Menu(edit_menu, tearoff=0)
-        convert_menu.add_command(label="Black and white", command=lambda: self.convert_current_image("1"))
-        convert_menu.add_command(label="Grayscale", command=lambda: self.convert_current_image("L"))
-        convert_menu.add_command(label="RGB", command=lambda: self.convert_current_image("RGB"))
-        convert_menu.add_command(label="RGBA", command=lambda: self.convert_current_image("RGBA"))
-        convert_menu.add_command(label="CMYK", command=lambda: self.convert_current_image("CMYK"))
-        convert_menu.add_command(label="LAB", command=lambda: self.convert_current_image("LAB"))
-        convert_menu.add_command(label="HSV", command=lambda: self.convert_current_image("HSV"))
-        convert_menu.add_command(label="Roll RGB colors", command=lambda: self.convert_current_image("roll"))
-        convert_menu.add_command(label="Red", command=lambda: self.convert_current_image("R"))
-        convert_menu.add_command(label="Green", command=lambda: self.convert_current_image("G"))
-        convert_menu.add_command(label="Blue", command=lambda: self.convert_current_image("B"))
+        for mode, label in CONVERT_MODES.items():
+            convert_menu.add_command(label=label, command=lambda x=mode: self.convert_current_image(x))
 
         enhance_menu = Menu(edit_menu, tearoff=0)
-        enhance_menu.add_command(label="Color", command=lambda: self.enhance_current_image("Color", ImageEnhance.Color))
-        enhance_menu.add_command(label="Contrast", command=lambda: self.enhance_current_image("Contrast", ImageEnhance.Contrast))
-        enhance_menu.add_command(label="Brightness", command=lambda: self.enhance_current_image("Brightness", ImageEnhance.Brightness))
-        enhance_menu.add_command(label="Sharpness", command=lambda: self.enhance_current_image("Sharpness", ImageEnhance.Sharpness))
+        for name, enhancer in ENHANCERS.items():
+            enhance_menu.add_command(
+                label=name.capitalize(), command=lambda x=name.capitalize(), y=enhancer: self.enhance_current_image(x, y)
+            )
 
         edit_menu.add_cascade(label="Rotate", menu=rotate_menu)
         edit_menu.add_cascade(label="Flip", menu=flip_menu)
@@ -142,9 +184,23 @@ class PyPhotoEditor:
         edit_menu.add_cascade(label="Enhance", menu=enhance_menu)
         edit_menu.add_separator()
         edit_menu.add_cascade(label="Crop", menu=crop_menu)
+        edit_menu.add_separator()
+        edit_menu.add_command(label="Export recipe", command=self.export_recipe_of_current_image)
 
         menu_bar.add_cascade(label="Edit", menu=edit_menu)
 
+        performance_menu = Menu(menu_bar, tearoff=0)
+        # timings are recorded only when they are turned on
+        self.profiling = BooleanVar(value=profiler.enabled)
+        performance_menu.add_checkbutton(label="Record timings", variable=self.profiling, command=self.toggle_profiling)
+        performance_menu.add_command(label="Show statistics", command=lambda: PerformanceWindow(self.root))
+        performance_menu.add_separator()
+        performance_menu.add_command(label="Export to JSON", command=lambda: self.export_profile("json"))
+        performance_menu.add_command(label="Export to CSV", command=lambda: self.export_profile("csv"))
+        performance_menu.add_separator()
+        performance_menu.add_command(label="Clear", command=profiler.clear)
+        menu_bar.add_cascade(label="Performance", menu=performance_menu)
+
         self.root.configure(menu=menu_bar)
 
     def update_open_recent_menu(self):
@@ -156,16 +212,95 @@ class PyPhotoEditor:
             self.open_recent_menu.add_command(label=path, command=lambda x=path: self.add_new_image(x))
 
     def draw_widgets(self):
-        self.image_tabs.pack(fill="both", expand=1)
+        # bound after session restore, so restored tabs are not decoded while they are added
+        self.image_tabs.bind("<<NotebookTabChanged>>", self.load_selected_image)
+
+    def load_selected_image(self, event=None):
+        current_tab = self.image_tabs.select()
+        if not current_tab:
+            return
+
+        image_info = self.opened_images[self.image_tabs.index(current_tab)]
+        self.tab_memory.touch(image_info)
+        # tab which is being added gets its canvas after it is shown, it is loaded by add_new_image then
+        if image_info.canvas is None:
+            return
+
+        if image_info.evicted:
+            self.restore_image_in_background(image_info)
+        else:
+            self.load_image_in_background(image_info)
+
+        self.tab_memory.enforce(self.opened_images, current=image_info)
+
+    def restore_image_in_background(self, image_info):
+        if image_info.loading:
+            return
+
+        image_info.loading = True
+        self.loader.submit(
+            image_info.read_evicted_image, image_info.spill_job,
+            callback=lambda images: image_info.restore(*images),
+            errback=lambda error: self.restore_failed(image_info, error)
+        )
+
+    def restore_image_now(self, image_info):
+        try:
+            image_info.restore(*image_info.read_evicted_image_now())
+        except OSError as e:
+            # file of the clean image could be moved or damaged after it was evicted
+            self.image_loading_failed(image_info, e)
+
+    def restore_failed(self, image_info, error):
+        # spill could be cancelled by the restore which has already given the pixels back
+        if image_info.evicted:
+            self.image_loading_failed(image_info, error)
 
     def load_images_from_config(self):
         with open(CONFIG_FILE, 'r') as f:
             config = json.load(f)
         
+        self.config = config
+        self.set_history_limits()
+
         self.last_viewed_images = config["last_viewed_images"]
         paths = config["opened_images"]
-        for path in paths:
-            self.add_new_image(path)
+        selected = config.get("selected_image", 0)
+
+        images = [self.add_image_tab(path) for path in paths]
+        selected_image = images[selected] if 0 <= selected < len(images) else None
+
+        # other images stay dormant till their tabs are selected, only thumbnails are decoded
+        for image_info in images:
+            if image_info is not None and image_info is not selected_image:
+                self.loader.submit(
+                    decode_thumbnail, image_info.full_path(),
+                    callback=image_info.set_thumbnail,
+                    errback=lambda error, info=image_info: self.image_loading_failed(info, error)
+                )
+
+        if selected_image is None:
+            return
+
+        # and only the selected one is decoded before the window is shown
+        try:
+            self.load_image_now(selected_image, proxy=True)
+        except (OSError, ValueError) as e:
+            self.image_loading_failed(selected_image, e)
+            return
+        self.image_tabs.select(selected_image.tab)
+
+    def set_history_limits(self):
+        history_memory.image_limit = config_limit(self.config, "history_memory_limit_mb", HISTORY_MEMORY_LIMIT)
+        history_memory.total_limit = config_limit(
+            self.config, "history_total_memory_limit_mb", HISTORY_TOTAL_MEMORY_LIMIT
+        )
+        history_memory.ram_limit = config_limit(self.config, "history_ram_limit_mb", HISTORY_RAM_LIMIT)
+
+        pack_mode = self.config.get("history_pack_mode", HISTORY_PACK_MODE)
+        history_memory.pack_mode = pack_mode if pack_mode in PACKERS else HISTORY_PACK_MODE
+
+        self.tab_memory.limit = config_limit(self.config, "tabs_memory_limit_mb", TABS_MEMORY_LIMIT)
 
     def open_new_images(self):
         image_paths = fd.askopenfilenames(filetypes=(("Images", "*.jpeg;*.jpg;*.png"), ))
@@ -184,43 +319,140 @@ class PyPhotoEditor:
         self.update_open_recent_menu()
 
     def add_new_image(self, image_path):
+        image_info = self.add_image_tab(image_path)
+        if image_info is not None:
+            self.load_image_in_background(image_info)
+
+    def add_image_tab(self, image_path):
         if not os.path.isfile(image_path):
             if image_path in self.last_viewed_images:
                 self.last_viewed_images.remove(image_path)
                 self.update_open_recent_menu()
-            return
+            return None
 
         opened_images = [info.path for info in self.opened_images]
         if image_path in opened_images:
             index = opened_images.index(image_path)
             self.image_tabs.select(index)
-            return
+            return None
 
-        image = Image.open(image_path)
         image_tab = Frame(self.image_tabs)
 
-        image_info = ImageInfo(image, image_path, image_tab)
+        # tab is shown right away, image is attached when it is decoded
+        image_info = ImageInfo(None, image_path, image_tab)
+        image_info.full_image_needed = lambda: self.load_full_image_in_background(image_info)
         self.opened_images.append(image_info)
 
         # make the canvas expandable
         image_tab.rowconfigure(0, weight=1)
         image_tab.columnconfigure(0, weight=1)
 
-        canvas = Canvas(image_tab, highlightthickness=0)
+        canvas = TkCanvas(image_tab, highlightthickness=0)
         canvas.grid(row=0, column=0, sticky='nsew')
-        canvas.update()  # wait till canvas is created
-        
-        image_info.set_canvas(canvas)
 
+        # tab is shown before the update, so canvas gets its size
         self.image_tabs.add(image_tab, text=image_info.filename())
         self.image_tabs.select(image_tab)
+        canvas.update()  # wait till canvas is created
+
+        image_info.set_canvas(canvas)
+
+        return image_info
+
+    def load_image_in_background(self, image_info):
+        if not image_info.dormant:
+            return
+
+        image_info.loading = True
+        self.loader.submit(
+            decode_proxy, image_info.full_path(), self.display_size(image_info),
+            callback=lambda proxy: self.proxy_decoded(image_info, proxy),
+            errback=lambda error: self.image_loading_failed(image_info, error)
+        )
+
+    def proxy_decoded(self, image_info, proxy):
+        image_info.loading = False
+        if image_info not in self.opened_images:
+            return
 
-    def current_image(self):
+        # image is not a JPEG or it is shown at full size anyway
+        if proxy is None:
+            self.load_full_image_in_background(image_info)
+            return
+
+        image_info.load_proxy(*proxy)
+
+    def load_full_image_in_background(self, image_info):
+        if image_info.loaded or image_info.loading:
+            return
+
+        image_info.loading = True
+        self.loader.submit(
+            decode_image, image_info.full_path(),
+            callback=lambda images: self.image_decoded(image_info, images),
+            errback=lambda error: self.image_loading_failed(image_info, error)
+        )
+
+    def image_decoded(self, image_info, images):
+        # tab was closed while image was decoded
+        if image_info not in self.opened_images:
+            return
+
+        image_info.load_image(*images)
+        current = self.current_image(decode=False)
+        self.tab_memory.enforce(self.opened_images, current=current)
+
+        # edits which waited for the image are done only if its tab is still selected
+        commands, image_info.waiting_commands = image_info.waiting_commands, []
+        if image_info is current:
+            for command in commands:
+                command()
+
+    def load_image_now(self, image_info, proxy=False):
+        path = image_info.full_path(no_star=True)
+
+        if proxy:
+            images = decode_proxy(path, self.display_size(image_info))
+            if images is not None:
+                image_info.load_proxy(*images)
+                return
+
+        image_info.load_image(*decode_image(path))
+
+    def display_size(self, image_info):
+        width, height = image_info.canvas.winfo_width(), image_info.canvas.winfo_height()
+        # canvas which is not laid out yet is 1x1, image is fitted into the screen then
+        if width <= 1 or height <= 1:
+            return self.root.winfo_screenwidth(), self.root.winfo_screenheight()
+        return width, height
+
+    def image_loading_failed(self, image_info, error):
+        # tab can be already closed by previous error
+        if image_info not in self.opened_images:
+            return
+
+        self.image_tabs.forget(image_info.tab)
+        self.opened_images.remove(image_info)
+        mb.showerror("Open error", f"Can't open '{image_info.full_path()}': {error}")
+
+    def current_image(self, decode=True):
         current_tab = self.image_tabs.select()
         if not current_tab:
             return None
         tab_number = self.image_tabs.index(current_tab)
-        return self.opened_images[tab_number]
+        image = self.opened_images[tab_number]
+
+        if decode and image.evicted:
+            # restore pixels of the tab right away, if loader has not done it yet
+            self.restore_image_now(image)
+            # tab is closed if its image can't be read back
+            if image not in self.opened_images:
+                return None
+
+        # image is still being loaded
+        if decode and not image.loaded:
+            return None
+        return image
 
     def save_current_image(self):
         image = self.current_image()
@@ -229,14 +461,16 @@ class PyPhotoEditor:
         if not image.unsaved:
             return
         
-        image.save()
-        self.image_tabs.add(image.tab, text=image.filename())
+        self.save_in_background(image)
 
+    @needs_full_image
     def save_image_as(self):
         image = self.current_image()
         if not image:
             return
         
+        # queued write still encodes the bitmap which save as closes
+        self.finish_saves(image)
         try:
             image.save_as()
             self.update_image_inside_app(image)
@@ -247,14 +481,49 @@ class PyPhotoEditor:
         for image_info in self.opened_images:
             if not image_info.unsaved:
                 continue
-            image_info.save()
-            self.image_tabs.tab(image_info.tab, text=image_info.filename())
+            if image_info.evicted:
+                self.restore_image_now(image_info)
+            self.save_in_background(image_info)
+
+    def save_in_background(self, image_info):
+        job = image_info.save_job()
+        if job is None:
+            return
+
+        image_info.saving += 1
+        self.image_tabs.tab(image_info.tab, text=image_info.title())
+
+        image_info.last_save = self.saver.submit(
+            write_after, image_info.last_save, job,
+            callback=lambda _: self.image_saved(image_info),
+            errback=lambda error: self.image_saving_failed(image_info, error)
+        )
+
+    def image_saved(self, image_info):
+        image_info.saving -= 1
+        if image_info in self.opened_images:
+            self.image_tabs.tab(image_info.tab, text=image_info.title())
+
+    def image_saving_failed(self, image_info, error):
+        image_info.saving -= 1
+        image_info.save_failed()
+        if image_info in self.opened_images:
+            self.image_tabs.tab(image_info.tab, text=image_info.title())
+
+        mb.showerror("Save error", f"Can't save '{image_info.full_path(no_star=True)}': {error}")
+
+    def finish_saves(self, image_info):
+        # failed write marks the image as unsaved again, so it is known before the tab is closed
+        if image_info.saving:
+            image_info.wait_for_saves()
+            self.saver.wait()
 
     def close_current_image(self):
-        image = self.current_image()
+        image = self.current_image(decode=False)
         if not image:
             return
-        
+
+        self.finish_saves(image)
         if image.unsaved:
             if not mb.askyesno("Unsaved changes", "Close without saving changes?"):
                 return
@@ -264,17 +533,20 @@ class PyPhotoEditor:
         self.opened_images.remove(image)
 
     def delete_current_image(self):
-        image = self.current_image()
+        image = self.current_image(decode=False)
         if not image:
             return
 
         if not mb.askokcancel("Delete image", "Are you sure you want to delete image?\nThis operation is unrecoverable!"):
             return
 
+        # queued write would create the deleted file again
+        self.finish_saves(image)
         image.delete()
         self.image_tabs.forget(image.tab)
         self.opened_images.remove(image)
 
+    @needs_full_image
     def move_current_image(self):
         image = self.current_image()
         if not image:
@@ -285,7 +557,11 @@ class PyPhotoEditor:
 
     def update_image_inside_app(self, image_info):
         image_info.update_image_on_canvas()
-        self.image_tabs.tab(image_info.tab, text=image_info.filename())
+        self.image_tabs.tab(image_info.tab, text=image_info.title())
+
+        # edits grow history, so other tabs may not fit into memory anymore
+        self.tab_memory.touch(image_info)
+        self.tab_memory.enforce(self.opened_images, current=image_info)
 
     def move_history_of_current_image(self, mode):
         image = self.current_image()
@@ -301,6 +577,7 @@ class PyPhotoEditor:
             image.unsaved = True
         self.update_image_inside_app(image)
 
+    @needs_full_image
     def rotate_current_image(self, degrees):
         image = self.current_image()
         if not image:
@@ -310,6 +587,7 @@ class PyPhotoEditor:
         image.unsaved = True
         self.update_image_inside_app(image)
 
+    @needs_full_image
     def flip_current_image(self, mode):
         image = self.current_image()
         if not image:
@@ -319,6 +597,7 @@ class PyPhotoEditor:
         image.unsaved = True
         self.update_image_inside_app(image)
 
+    @needs_full_image
     def resize_current_image(self, percents):
         image = self.current_image()
         if not image:
@@ -328,15 +607,17 @@ class PyPhotoEditor:
         image.unsaved = True
         self.update_image_inside_app(image)
 
-    def apply_filter_to_current_image(self, filter_type):
+    @needs_full_image
+    def apply_filter_to_current_image(self, name):
         image = self.current_image()
         if not image:
             return
 
-        image.filter(filter_type)
+        image.filter(name)
         image.unsaved = True
         self.update_image_inside_app(image)
 
+    @needs_full_image
     def start_crop_selection_of_current_image(self):
         image = self.current_image()
         if not image:
@@ -366,6 +647,7 @@ class PyPhotoEditor:
         except ValueError as e:
             mb.showerror("Crop selection error", str(e))
 
+    @needs_full_image
     def convert_current_image(self, mode):
         image = self.current_image()
         if not image:
@@ -378,6 +660,7 @@ class PyPhotoEditor:
         except ValueError as e:
             mb.showerror("Convert error", str(e))
 
+    @needs_full_image
     def enhance_current_image(self, name, enhance):
         image = self.current_image()
         if not image:
@@ -385,10 +668,55 @@ class PyPhotoEditor:
         
         EnhanceSliderWindow(self.root, name, enhance, image, self.update_image_inside_app)
 
-    def save_to_clipboard(self, mode):
+    def export_recipe_of_current_image(self):
         image = self.current_image()
         if not image:
             return
+
+        recipe = image.recipe()
+        if recipe is None:
+            mb.showerror("Export recipe error", "Some edits of the image can't be written to recipe")
+            return
+        if not recipe:
+            mb.showinfo("Export recipe", "Image has no edits to export")
+            return
+
+        path = fd.asksaveasfilename(
+            initialdir=image.directory(no_star=True),
+            defaultextension=".json",
+            filetypes=[("Recipes", "*.json"), ]
+        )
+        if not path:
+            return
+
+        # recipe is replayed by "python -m PyPhotoEditor.batch --recipe"
+        with atomic_write(path, 'w') as f:
+            json.dump(recipe_to_dict(recipe), f, indent=4)
+
+    def toggle_profiling(self):
+        if self.profiling.get():
+            profiler.enable()
+        else:
+            profiler.disable()
+
+    def export_profile(self, file_type):
+        path = fd.asksaveasfilename(
+            defaultextension=f".{file_type}",
+            filetypes=[(file_type.upper(), f"*.{file_type}"), ]
+        )
+        if not path:
+            return
+
+        with atomic_write(path, 'w', newline='') as f:
+            if file_type == "json":
+                profiler.export_json(f)
+            else:
+                profiler.export_csv(f)
+
+    def save_to_clipboard(self, mode):
+        image = self.current_image(decode=False)
+        if not image:
+            return
         
         if mode == "name":
             pyperclip.copy(image.filename(no_star=True))
@@ -399,9 +727,13 @@ class PyPhotoEditor:
 
     def save_images_to_config(self):
         paths = [info.full_path(no_star=True) for info in self.opened_images]
-        images = {"opened_images": paths, "last_viewed_images": self.last_viewed_images}
-        with open(CONFIG_FILE, 'w') as f:
-            json.dump(images, f, indent=4)
+        # keep settings which were set by user in config
+        self.config["opened_images"] = paths
+        current_tab = self.image_tabs.select()
+        self.config["selected_image"] = self.image_tabs.index(current_tab) if current_tab else 0
+        self.config["last_viewed_images"] = self.last_viewed_images
+        with atomic_write(CONFIG_FILE, 'w') as f:
+            json.dump(self.config, f, indent=4)
 
     def unsaved_images(self):
         for info in self.opened_images:
@@ -410,6 +742,9 @@ class PyPhotoEditor:
         return False
 
     def _close(self, event=None):
+        # don't lose images which are still written, failed write marks its image as unsaved before the prompt
+        self.saver.wait()
+
         if self.unsaved_images():
             if not mb.askyesno("Unsaved changes", "Got unsaved changes! Exit anyway?"):
                 return
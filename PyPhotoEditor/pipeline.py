@@ -0,0 +1,124 @@
+import queue
+import threading
+
+# items waiting between two stages, it bounds the memory taken by images in flight
+QUEUE_SIZE = 8
+# how often blocked stages check if the pipeline was stopped, s
+STOP_CHECK_INTERVAL = 0.1
+
+_END = object()
+
+
+class Stage:
+    def __init__(self, fn, workers=1):
+        self.fn = fn
+        self.workers = workers
+
+
+class Item:
+    def __init__(self, source):
+        self.source = source
+        self.value = source
+        self.error = None
+
+
+class Countdown:
+    def __init__(self, count):
+        self.count = count
+        self.lock = threading.Lock()
+
+    def done(self):
+        # true for the last of the counted workers
+        with self.lock:
+            self.count -= 1
+            return self.count == 0
+
+
+class Pipeline:
+    def __init__(self, stages, queue_size=QUEUE_SIZE):
+        self.stages = stages
+        self.queue_size = queue_size
+
+    def run(self, sources):
+        # generator of (source, result, error) in order of completion, sources are read lazily
+        stop = threading.Event()
+        feed_errors = []
+        queues = [queue.Queue(self.queue_size) for _ in range(len(self.stages) + 1)]
+
+        threads = [threading.Thread(target=self._feed, args=(sources, queues[0], stop, feed_errors), daemon=True)]
+        for stage, source, target in zip(self.stages, queues, queues[1:]):
+            finished = Countdown(stage.workers)
+            for _ in range(stage.workers):
+                threads.append(threading.Thread(
+                    target=self._work, args=(stage, source, target, finished, stop), daemon=True
+                ))
+
+        for thread in threads:
+            thread.start()
+
+        try:
+            while True:
+                item = queues[-1].get()
+                if item is _END:
+                    break
+                yield item.source, item.value, item.error
+        finally:
+            # consumer can stop reading results, then all stages are stopped too
+            stop.set()
+            for thread in threads:
+                thread.join()
+
+        if feed_errors:
+            raise feed_errors[0]
+
+    @staticmethod
+    def _put(target, item, stop):
+        while not stop.is_set():
+            try:
+                target.put(item, timeout=STOP_CHECK_INTERVAL)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    @staticmethod
+    def _get(source, stop):
+        while not stop.is_set():
+            try:
+                return source.get(timeout=STOP_CHECK_INTERVAL)
+            except queue.Empty:
+                pass
+        return None
+
+    def _feed(self, sources, target, stop, errors):
+        try:
+            for source in sources:
+                if not self._put(target, Item(source), stop):
+                    return
+        except Exception as e:
+            errors.append(e)
+        self._put(target, _END, stop)
+
+    def _work(self, stage, source, target, finished, stop):
+        while True:
+            item = self._get(source, stop)
+            if item is None:
+                return
+
+            if item is _END:
+                # end is passed to the other workers of the stage, and by the last one to the next stage
+                self._put(source, _END, stop)
+                if finished.done():
+                    self._put(target, _END, stop)
+                return
+
+            # failed item skips the rest of stages
+            if item.error is None:
+                try:
+                    item.value = stage.fn(item.value)
+                except Exception as e:
+                    item.value = None
+                    item.error = e
+
+            if not self._put(target, item, stop):
+                return
@@ -0,0 +1,160 @@
+import collections
+import contextlib
+import csv
+import functools
+import json
+import math
+import threading
+import time
+
+# samples kept for percentiles of every operation, the oldest ones are forgotten
+PROFILE_SAMPLES = 10000
+PERCENTILES = (50, 90, 99)
+
+
+def percentile(values, percent):
+    # nearest rank of sorted values
+    index = max(math.ceil(percent / 100 * len(values)) - 1, 0)
+    return values[min(index, len(values) - 1)]
+
+
+class Sample:
+    __slots__ = ("wall", "cpu", "pixels", "nbytes")
+
+    def __init__(self, wall, cpu, pixels, nbytes):
+        self.wall = wall
+        self.cpu = cpu
+        self.pixels = pixels
+        # memory of the bitmaps which were made by the call
+        self.nbytes = nbytes
+
+
+class Measurement:
+    def __init__(self, pixels=0, nbytes=0):
+        # pixels and bytes can be set inside the measured block, when they become known
+        self.pixels = pixels
+        self.nbytes = nbytes
+
+
+class OperationStats:
+    def __init__(self, name, max_samples=PROFILE_SAMPLES):
+        self.name = name
+        self.calls = 0
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.pixels = 0
+        self.samples = collections.deque(maxlen=max_samples)
+
+    def add(self, sample):
+        self.calls += 1
+        self.wall += sample.wall
+        self.cpu += sample.cpu
+        self.pixels += sample.pixels
+        self.samples.append(sample)
+
+    def summary(self):
+        walls = sorted(sample.wall for sample in self.samples)
+        cpus = sorted(sample.cpu for sample in self.samples)
+        nbytes = [sample.nbytes for sample in self.samples]
+
+        summary = {
+            "operation": self.name,
+            "calls": self.calls,
+            "wall_total_ms": self.wall * 1000,
+            "wall_mean_ms": self.wall / self.calls * 1000,
+        }
+        for percent in PERCENTILES:
+            summary[f"wall_p{percent}_ms"] = percentile(walls, percent) * 1000
+        summary["wall_max_ms"] = walls[-1] * 1000
+        summary["cpu_total_ms"] = self.cpu * 1000
+        summary["cpu_mean_ms"] = self.cpu / self.calls * 1000
+        summary["cpu_p90_ms"] = percentile(cpus, 90) * 1000
+        summary["pixels_total"] = self.pixels
+        summary["mpixels_per_s"] = self.pixels / self.wall / 1e6 if self.wall else 0.0
+        summary["bitmaps_max_kb"] = max(nbytes) / 1024
+        return summary
+
+
+class Profiler:
+    def __init__(self):
+        self.enabled = False
+        self.stats = {}
+        self.lock = threading.Lock()
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def clear(self):
+        with self.lock:
+            self.stats.clear()
+
+    @contextlib.contextmanager
+    def measure(self, name, pixels=0):
+        measurement = Measurement(pixels)
+        if not self.enabled:
+            yield measurement
+            return
+
+        wall, cpu = time.perf_counter(), time.thread_time()
+        try:
+            yield measurement
+        finally:
+            wall, cpu = time.perf_counter() - wall, time.thread_time() - cpu
+            self.add(name, Sample(wall, cpu, measurement.pixels, measurement.nbytes))
+
+    def add(self, name, sample):
+        with self.lock:
+            if name not in self.stats:
+                self.stats[name] = OperationStats(name)
+            self.stats[name].add(sample)
+
+    def summary(self):
+        with self.lock:
+            stats = list(self.stats.values())
+        return [operation.summary() for operation in sorted(stats, key=lambda s: s.wall, reverse=True)]
+
+    def export_json(self, f):
+        with self.lock:
+            samples = {
+                name: [[s.wall, s.cpu, s.pixels, s.nbytes] for s in operation.samples]
+                for name, operation in self.stats.items()
+            }
+        json.dump({
+            "summary": self.summary(),
+            "sample_fields": ["wall_s", "cpu_s", "pixels", "bitmap_bytes"],
+            "samples": samples,
+        }, f, indent=4)
+
+    def export_csv(self, f):
+        summary = self.summary()
+        if not summary:
+            return
+        writer = csv.DictWriter(f, fieldnames=list(summary[0]))
+        writer.writeheader()
+        writer.writerows(summary)
+
+
+profiler = Profiler()
+
+
+def profiled(name, pixels=None, result_pixels=None, nbytes=None):
+    # pixels are counted from the arguments before the call or from the result after it,
+    # bytes of the bitmaps made by the call are counted after it from the result and the arguments
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not profiler.enabled:
+                return fn(*args, **kwargs)
+
+            with profiler.measure(name, pixels(*args, **kwargs) if pixels is not None else 0) as measurement:
+                result = fn(*args, **kwargs)
+                if result_pixels is not None:
+                    measurement.pixels = result_pixels(result)
+                if nbytes is not None:
+                    measurement.nbytes = nbytes(result, *args, **kwargs)
+            return result
+        return wrapper
+    return decorator
@@ -0,0 +1,33 @@
+import time
+import weakref
+
+from history import MB
+
+# memory for pixels and history of all opened tabs
+TABS_MEMORY_LIMIT = 4096 * MB
+
+
+class TabMemory:
+    def __init__(self, pool, limit=TABS_MEMORY_LIMIT):
+        # pool which writes pixels of evicted tabs, so switching tabs doesn't wait for the disk
+        self.pool = pool
+        self.limit = limit
+        self.last_access = weakref.WeakKeyDictionary()
+
+    def touch(self, image_info):
+        self.last_access[image_info] = time.monotonic()
+
+    def enforce(self, images, current=None):
+        resident = [info for info in images if info.loaded and not info.evicted]
+        total = sum(info.nbytes for info in resident)
+
+        # tabs which were not viewed for the longest time are evicted first
+        for info in sorted(resident, key=lambda info: self.last_access.get(info, 0.0)):
+            if total <= self.limit:
+                break
+            # image which is still written is not in its file yet, so it can't be read back from there
+            if info is current or info.saving:
+                continue
+
+            total -= info.nbytes
+            info.evict(self.pool)
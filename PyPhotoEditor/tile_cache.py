@@ -0,0 +1,32 @@
+from collections import OrderedDict
+
+TILE_CACHE_SIZE = 256
+
+
+class TileCache:
+    def __init__(self, capacity=TILE_CACHE_SIZE):
+        self.capacity = capacity
+        self.tiles = OrderedDict()
+
+    def get(self, key):
+        tile = self.tiles.get(key)
+        if tile is not None:
+            # mark tile as recently used
+            self.tiles.move_to_end(key)
+        return tile
+
+    def put(self, key, tile):
+        self.tiles[key] = tile
+        self.tiles.move_to_end(key)
+
+        while len(self.tiles) > self.capacity:
+            self.tiles.popitem(last=False)
+
+    def clear(self):
+        self.tiles.clear()
+
+    def __contains__(self, key):
+        return key in self.tiles
+
+    def __len__(self):
+        return len(self.tiles)
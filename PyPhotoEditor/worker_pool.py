@@ -0,0 +1,69 @@
+from concurrent.futures import ThreadPoolExecutor
+import concurrent.futures
+import queue
+
+# how often finished jobs are checked from the Tk thread, ms
+POLL_INTERVAL = 10
+
+
+class TkWorkerPool:
+    def __init__(self, widget, executor=None, max_workers=None, poll_interval=POLL_INTERVAL):
+        self.widget = widget
+        self.executor = executor if executor is not None else ThreadPoolExecutor(max_workers=max_workers)
+        self.poll_interval = poll_interval
+
+        # finished futures are handed over to the Tk thread through this queue
+        self.finished = queue.Queue()
+        self.pending = 0
+        self.poll_job = None
+        self.futures = set()
+
+    def submit(self, fn, *args, callback=None, errback=None):
+        future = self.executor.submit(fn, *args)
+        self.pending += 1
+        self.futures.add(future)
+        future.add_done_callback(lambda f: self.finished.put((f, callback, errback)))
+
+        self._start_polling()
+        return future
+
+    def _start_polling(self):
+        if self.poll_job is None:
+            self.poll_job = self.widget.after(self.poll_interval, self._poll)
+
+    def _poll(self):
+        self.poll_job = None
+
+        try:
+            while True:
+                try:
+                    future, callback, errback = self.finished.get_nowait()
+                except queue.Empty:
+                    break
+
+                self.pending -= 1
+                self.futures.discard(future)
+                if future.cancelled():
+                    continue
+
+                error = future.exception()
+                if error is not None:
+                    if errback is None:
+                        raise error
+                    errback(error)
+                elif callback is not None:
+                    callback(future.result())
+        finally:
+            if self.pending > 0:
+                self._start_polling()
+
+    def wait(self):
+        # block till all submitted jobs are finished and hand over their results
+        concurrent.futures.wait(list(self.futures))
+        self.cancel_polling()
+        self._poll()
+
+    def cancel_polling(self):
+        if self.poll_job is not None:
+            self.widget.after_cancel(self.poll_job)
+            self.poll_job = None